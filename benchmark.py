@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# Headless benchmarks for sqlite-tui3.py, so performance changes can be compared between commits:
+#   python benchmark.py --sizes 10k,1M --out before.json
+#   python benchmark.py --sizes 10k,1M --set virtualrows=False --out after.json
+# Synthetic dbs (narrow/wide, with/without a primary key) are generated once into --dir and reused. Each case runs
+# the app in its own process (driven by Textual's run_test/Pilot), so peak RSS is that case's alone.
+# Measures time to first paint, G and ctrl+f latency, search time for a near and a far hit, and edit throughput
+# through changecell. Results are JSON: {'commit', 'settings', 'results': [{case..., measurements...}]}.
+# --profiles default,large,readonly runs every case once per connection profile (see dbconn.py), and prints a table
+# comparing them. Edits are skipped for the read-only ones.
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+shapes = {
+	'narrow': ['name TEXT', 'visited INTEGER', 'note TEXT'],
+	'wide': ['name TEXT', 'visited INTEGER', 'note TEXT'] + [f'c{i} {"INTEGER" if i % 2 else "TEXT"}' for i in range(4, 30)],
+}
+sizes = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '10M': 10_000_000}
+appsize = (120, 40)  # terminal size the app runs at
+repeats = 20  # ctrl+f presses
+edits = 500  # changecell calls for the edit throughput
+
+def rowname(i):
+	return f'row{i:08d}'  # what the search benchmarks look for
+
+def makedb(dirname, size, shape, pk):
+	# Returns (db file, table). Reused if it's there already.
+	table = 'bench'
+	dbfile = os.path.join(dirname, f"bench-{size}-{shape}-{'pk' if pk else 'nopk'}.db")
+	if os.path.isfile(dbfile):
+		return dbfile, table
+	n = sizes[size]
+	cols = shapes[shape]
+	print(f'Generating {dbfile} ({n} rows)', file=sys.stderr)
+	tmpfile = dbfile + '.tmp'
+	if os.path.exists(tmpfile):
+		os.remove(tmpfile)
+	conn = sqlite3.connect(tmpfile)
+	conn.execute("PRAGMA journal_mode=OFF;")
+	conn.execute("PRAGMA synchronous=OFF;")
+	conn.execute(f"CREATE TABLE {table} ({'id INTEGER PRIMARY KEY, ' if pk else ''}{', '.join(cols)});")
+	extra = len(cols) - 3
+
+	def rows():
+		for i in range(1, n + 1):
+			yield (rowname(i), i % 2, f'note {i % 1000}', *[i % 997 if j % 2 else f'text{i % 101}' for j in range(extra)])
+
+	conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(cols))});" if not pk else
+		f"INSERT INTO {table} ({', '.join(col.split()[0] for col in cols)}) VALUES ({', '.join('?' * len(cols))});", rows())
+	conn.commit()
+	conn.execute("PRAGMA journal_mode=WAL;")  # what the app leaves dbs in anyway
+	conn.close()
+	os.rename(tmpfile, dbfile)
+	return dbfile, table
+
+def loadapp(dbfile, table, settings):
+	spec = importlib.util.spec_from_file_location('tui', os.path.join(here, 'sqlite-tui3.py'))
+	tui = importlib.util.module_from_spec(spec)
+	sys.modules['tui'] = tui
+	spec.loader.exec_module(tui)
+	tui.dbfname = os.path.basename(dbfile)
+	tui.dbtable = table
+	for name, value in settings.items():
+		setattr(tui, name, value)
+	return tui
+
+async def waitfor(pilot, done, timeout=300):
+	start = time.perf_counter()
+	while not done():
+		if time.perf_counter() - start > timeout:
+			raise TimeoutError
+		await pilot.pause(0.001)
+
+async def runcase(dbfile, table, n, settings):
+	# Runs in the case's own process (see main)
+	result = {}
+	os.chdir(os.path.dirname(dbfile))  # the app looks for its db from the current directory up
+	start = time.perf_counter()
+	tui = loadapp(dbfile, table, settings)
+	result['import_ms'] = (time.perf_counter() - start) * 1000
+	tui.app = tui.TableApp()  # the screens use the module's app
+	start = time.perf_counter()
+	async with tui.app.run_test(size=appsize) as pilot:
+		screen = tui.app.get_screen_stack('table')[0]
+		table = screen.query_one(tui.DataTable)
+		await waitfor(pilot, lambda: table.row_count > 0)
+		await pilot.pause()
+		result['firstpaint_ms'] = (time.perf_counter() - start) * 1000
+		await waitfor(pilot, lambda: not screen.loading)  # whole table loaded (virtualrows off)
+		result['loaded_ms'] = (time.perf_counter() - start) * 1000
+
+		def cursorpk():
+			return table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value
+
+		async def timed(*keys):
+			start = time.perf_counter()
+			await pilot.press(*keys)
+			await pilot.pause()
+			return (time.perf_counter() - start) * 1000
+
+		result['G_ms'] = await timed('G')
+		result['g_ms'] = await timed('g')
+		result['ctrlf_ms'] = statistics.median([await timed('ctrl+f') for i in range(repeats)])
+		await timed('g')
+
+		# Search: time to the first jump, and until every match has been found
+		searchbar = screen.query_one(tui.TextAreaSearch)
+		for name, target in (('near', 10), ('far', n - 10)):
+			await pilot.press('g', 'slash')
+			searchbar.load_text(rowname(target))
+			topk = cursorpk()
+			start = time.perf_counter()
+			await pilot.press('enter')
+			await waitfor(pilot, lambda: cursorpk() != topk)
+			result[f'search_{name}_ms'] = (time.perf_counter() - start) * 1000
+			await waitfor(pilot, lambda: not [worker for worker in tui.app.workers if worker.group == 'search' and not worker.is_finished])
+			result[f'search_{name}_all_ms'] = (time.perf_counter() - start) * 1000
+
+		# Edits: toggle the boolean column of the first rows through changecell, i.e. one commit (and undo push) each
+		await pilot.press('g')
+		if not tui.dbconn.writable(tui.connprofile):
+			screen.workers.cancel_all()
+			result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+			return result
+		col = screen.headers.index('visited')
+		rows = min(table.row_count, 100)
+		start = time.perf_counter()
+		for i in range(edits):
+			row = i % rows
+			pk = table.coordinate_to_cell_key((row, col)).row_key.value
+			value = table.get_cell_at((row, col))
+			screen.changecell(f'update {tui.dbtable} set visited=? where {screen.pkname}=?', pk, 1 - value, value, row, col)
+		if screen.writer:
+			screen.writer.flush()
+		seconds = time.perf_counter() - start
+		result['edits_per_s'] = edits / seconds
+		await pilot.pause()
+		screen.workers.cancel_all()
+	result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return result
+
+def compare(results, profiles):
+	# One line per case and measurement, with a column per profile
+	metrics = [metric for metric in results[0] if metric.endswith(('_ms', '_per_s', '_kb'))] if results else []
+	print(f"{'case':24} {'':20}" + ''.join(f'{profile:>12}' for profile in profiles), file=sys.stderr)
+	cases = {}
+	for result in results:
+		cases.setdefault((result['size'], result['shape'], result['pk']), {})[result['profile']] = result
+	for (size, shape, pk), byprofile in cases.items():
+		for metric in metrics:
+			values = [byprofile.get(profile, {}).get(metric) for profile in profiles]
+			cells = ''.join(f'{value:12.1f}' if isinstance(value, (int, float)) else f"{'-':>12}" for value in values)
+			case = f"{size} {shape} {'pk' if pk else 'nopk'}"
+			print(f'{case:24} {metric:20}{cells}', file=sys.stderr)
+
+def parsevalue(text):
+	try:
+		return eval(text, {})  # True, 0.5, 'regexp'...
+	except Exception:
+		return text
+
+def main():
+	parser = argparse.ArgumentParser(description='Headless benchmarks for sqlite-tui3.py')
+	parser.add_argument('--sizes', default='10k,1M,10M', help=f"comma-separated, of {', '.join(sizes)}")
+	parser.add_argument('--shapes', default='narrow,wide')
+	parser.add_argument('--pk', default='pk,nopk', help='pk, nopk or both (nopk tables go by rowid)')
+	parser.add_argument('--profiles', help='comma-separated connection profiles to compare (see dbconn.py), e.g. default,large,readonly')
+	parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help='set one of the app\'s settings, e.g. virtualrows=False')
+	parser.add_argument('--dir', default=os.path.join(tempfile.gettempdir(), 'sqlite-tui-bench'), help='where the generated dbs go')
+	parser.add_argument('--out', help='write the JSON here instead of stdout')
+	parser.add_argument('--case', nargs=3, metavar=('DBFILE', 'TABLE', 'ROWS'), help=argparse.SUPPRESS)  # one case, in its own process
+	args = parser.parse_args()
+	settings = {name: parsevalue(value) for name, value in (setting.split('=', 1) for setting in args.set)}
+
+	if args.case:
+		dbfile, table, n = args.case
+		result = asyncio.run(runcase(dbfile, table, int(n), settings))
+		with open(args.out, 'w') as f:
+			json.dump(result, f)
+		return
+
+	os.makedirs(args.dir, exist_ok=True)
+	profiles = args.profiles.split(',') if args.profiles else [None]  # None: whatever connprofile is (or --set makes it)
+	results = []
+	for size in args.sizes.split(','):
+		for shape in args.shapes.split(','):
+			for pk in args.pk.split(','):
+				dbfile, table = makedb(args.dir, size, shape, pk == 'pk')
+				for profile in profiles:
+					for fname in (f'{dbfile}-tui', f'{dbfile}-wal', f'{dbfile}-shm'):
+						if os.path.exists(fname):
+							os.remove(fname)  # start without an undo journal, fts index etc. from the last run
+					case = {'size': size, 'rows': sizes[size], 'shape': shape, 'pk': pk == 'pk'}
+					if profile:
+						case['profile'] = profile
+					print(f'Running {case}', file=sys.stderr)
+					with tempfile.NamedTemporaryFile(suffix='.json') as out:
+						cmd = [sys.executable, os.path.abspath(__file__), '--case', dbfile, table, str(sizes[size]), '--out', out.name]
+						cmd += [f'--set={setting}' for setting in args.set]
+						if profile:
+							cmd += [f"--set=connprofile='{profile}'"]
+						proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+						if proc.returncode:
+							case['error'] = proc.stderr.strip().splitlines()[-1:] or proc.returncode
+						else:
+							case.update(json.load(open(out.name)))
+					results.append(case)
+
+	commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=here, capture_output=True, text=True).stdout.strip()
+	report = {'commit': commit, 'python': sys.version.split()[0], 'sqlite': sqlite3.sqlite_version, 'settings': settings, 'results': results}
+	if args.profiles:
+		compare([result for result in results if 'error' not in result], profiles)
+	if args.out:
+		with open(args.out, 'w') as f:
+			json.dump(report, f, indent=1)
+	else:
+		print(json.dumps(report, indent=1))
+
+if __name__ == "__main__":
+	main()
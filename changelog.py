@@ -0,0 +1,35 @@
+# Optional change log for seeing exactly which rows other programs changed (see changelog in sqlite-tui3.py).
+# Temp triggers only fire for changes made through the connection that created them, so this has to be real
+# triggers plus a log table in the user's db: every insert/update/delete of tbl logs the pk. That's a (small) write
+# cost for every program writing to the table, so it's opt-in. Without it, refresh re-reads the loaded rows instead.
+
+# Usage: install, lastseq, changed, prune
+
+schema = """
+CREATE TABLE IF NOT EXISTS _tui_changes (
+	seq INTEGER PRIMARY KEY,
+	tbl TEXT,
+	pk
+);
+"""
+
+def install(conn, tbl, pkname):
+	conn.executescript(schema)
+	log = f"INSERT INTO _tui_changes (tbl, pk) VALUES ('{tbl}', "
+	conn.execute(f"CREATE TRIGGER IF NOT EXISTS _tui_changes_{tbl}_i AFTER INSERT ON {tbl} BEGIN {log}new.{pkname}); END;")
+	conn.execute(f"CREATE TRIGGER IF NOT EXISTS _tui_changes_{tbl}_u AFTER UPDATE ON {tbl} BEGIN {log}old.{pkname}); {log}new.{pkname}); END;")
+	conn.execute(f"CREATE TRIGGER IF NOT EXISTS _tui_changes_{tbl}_d AFTER DELETE ON {tbl} BEGIN {log}old.{pkname}); END;")
+	conn.commit()
+
+def lastseq(conn):
+	return conn.execute("SELECT coalesce(max(seq), 0) FROM _tui_changes;").fetchone()[0]
+
+def changed(conn, tbl, since, upto):
+	# pks changed after seq `since` up to seq `upto`
+	return {row[0] for row in conn.execute("SELECT DISTINCT pk FROM _tui_changes WHERE tbl = ? AND seq > ? AND seq <= ?;", (tbl, since, upto))}
+
+def prune(conn, tbl, seq):
+	# Done with everything up to seq. Assumes we're the only reader of the log. The newest entry stays, since seq has
+	# no AUTOINCREMENT: with the log empty, sqlite would start over at 1, below the seqs we've seen.
+	conn.execute("DELETE FROM _tui_changes WHERE tbl = ? AND seq <= ? AND seq < (SELECT max(seq) FROM _tui_changes);", (tbl, seq))
+	conn.commit()
@@ -0,0 +1,61 @@
+# Opening the user's db, going by a connection profile (see connprofile in sqlite-tui3.py), so the UI's connection,
+# the workers', the write-behind writer's and the command line's are all set up the same way. Profiles are PRAGMAs
+# for big dbs (mmap, page cache, temp tables in memory, how long to wait on other writers), plus read-only and
+# immutable opens for browsing snapshots and dbs on network or archival storage without ever writing to them.
+
+# Usage: profiles, connect, writable, busy
+
+import sqlite3
+from urllib.parse import quote
+
+profiles = {
+	# As it always was: switch the db to WAL (for good), so workers can read while the UI writes
+	'default': {'journal_mode': 'WAL'},
+	# Big local dbs: reads through mmap instead of read() calls, a 256 MB page cache, sorts and temp indexes in memory
+	'large': {'journal_mode': 'WAL', 'mmap_size': 1 << 30, 'cache_size': -256 * 1024, 'temp_store': 'MEMORY', 'busy_timeout': 5000},
+	# Dbs other programs write to: leave the journal mode alone, and wait longer for their write locks
+	'shared': {'busy_timeout': 30000},
+	# Browse only. Edits are refused, and nothing is written to the db (the sidecar file is still used).
+	'readonly': {'mode': 'ro', 'query_only': 1, 'mmap_size': 1 << 30, 'cache_size': -256 * 1024, 'temp_store': 'MEMORY'},
+	# For files nothing writes to anymore (snapshots, network or archival storage): no locking, no -wal/-shm files,
+	# and changes by other programs are never noticed, since sqlite assumes there can't be any. A WAL db's -wal file is
+	# ignored too, so checkpoint it first.
+	'snapshot': {'mode': 'ro', 'immutable': 1, 'query_only': 1, 'mmap_size': 1 << 30, 'cache_size': -256 * 1024, 'temp_store': 'MEMORY'},
+}
+uriparms = ('mode', 'immutable')  # go in the file: URI, the rest are PRAGMAs
+
+def writable(profile):
+	settings = profiles[profile]
+	return settings.get('mode') != 'ro' and not settings.get('query_only')
+
+def busy(error):
+	# Did error come from another connection holding a lock (for longer than busy_timeout)?
+	return isinstance(error, sqlite3.OperationalError) and getattr(error, 'sqlite_errorcode', 0) & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+def connect(dbfile, profile='default', factory=sqlite3.Connection, **kwargs):
+	# sqlite3.connect(dbfile) set up by profile. kwargs go to sqlite3.connect (e.g. isolation_level).
+	settings = profiles[profile]
+	parms = '&'.join(f'{parm}={settings[parm]}' for parm in uriparms if parm in settings)
+	conn = sqlite3.connect(f"file:{quote(dbfile)}{'?' + parms if parms else ''}", uri=True, factory=factory, **kwargs)
+	for pragma, value in settings.items():
+		if pragma in uriparms:
+			continue
+		if pragma == 'journal_mode':
+			if conn.execute("PRAGMA journal_mode;").fetchone()[0].upper() == value.upper():
+				continue  # switching is a write, even if it's the mode the db is in already
+			try:
+				conn.execute(f"PRAGMA journal_mode={value};").fetchone()
+			except sqlite3.OperationalError:
+				pass  # e.g. read-only file or directory. Works as it is, just with readers and writers blocking each other.
+		else:
+			conn.execute(f"PRAGMA {pragma}={value};")
+	return conn
+
+if __name__ == "__main__":
+	import sys
+	import tempfile
+	dbfile = sys.argv[1] if len(sys.argv) > 1 else tempfile.mktemp(suffix='.db')
+	sqlite3.connect(dbfile).execute('create table if not exists t (id integer primary key)')
+	for profile in profiles:
+		conn = connect(dbfile, profile)
+		print(profile, [(pragma, conn.execute(f'PRAGMA {pragma}').fetchone()[0]) for pragma in ('journal_mode', 'mmap_size', 'cache_size', 'temp_store', 'busy_timeout', 'query_only')], writable(profile))
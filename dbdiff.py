@@ -0,0 +1,92 @@
+# Diff of a table against the same table in another db (e.g. last night's copy), by primary key. The other db gets
+# ATTACHed to the connection doing the diff. Both sides are cut into the same pk ranges of chunksize rows (going by
+# the main side), and each range is hashed on both sides in sqlite: rows are serialized with json_array() (blobs as
+# hex) and group_concat(), and only the concatenation of a whole chunk is passed to Python to hash. Only chunks whose
+# hashes differ are fetched and compared row by row, so neither table is ever loaded whole.
+
+# Usage: attach, columns, diff
+
+import hashlib
+from urllib.parse import quote
+
+def chunkhash(text):
+	return None if text is None else hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+def attach(conn, path, name='old'):
+	# Read-only, so a snapshot can't be changed by accident (conn has to be opened with uri=True, see dbconn.py)
+	conn.execute(f"ATTACH ? AS {name};", (f'file:{quote(path)}?mode=ro',))
+	conn.create_function('tui_chunkhash', 1, chunkhash, deterministic=True)
+
+def columns(conn, tbl, name='old'):
+	# Column names of tbl in the attached db, or None if it has no such table
+	if conn.execute(f"SELECT 1 FROM {name}.sqlite_master WHERE name = ? AND type = 'table';", (tbl,)).fetchone() is None:
+		return None
+	return [row[1] for row in conn.execute(f"PRAGMA {name}.table_info({tbl});")]
+
+def bounds(conn, tbl, pk, chunksize, intpk):
+	# pks that cut main.tbl into chunks of chunksize rows, taken from the data so gaps in the pks don't matter. With an
+	# integer pk (intpk, the rowid) each cut is a seek to the last one and a step of chunksize rows, else it takes a
+	# row_number() pass over the pk index.
+	if intpk:
+		cuts = []
+		while True:
+			where = f'WHERE {pk} > ?' if cuts else ''
+			row = conn.execute(f"SELECT {pk} FROM main.{tbl} {where} ORDER BY {pk} LIMIT 1 OFFSET ?;", (*cuts[-1:], chunksize - 1)).fetchone()
+			if row is None:
+				return cuts
+			cuts.append(row[0])
+	return [row[0] for row in conn.execute(f"SELECT {pk} FROM (SELECT {pk}, row_number() OVER (ORDER BY {pk}) AS n FROM main.{tbl}) WHERE n % ? = 0;", (chunksize,))]
+
+def diff(conn, tbl, pk, cols, name='old', chunksize=10000, intpk=False, progress=None, cancelled=None):
+	# Yields ('added', pk, None), ('removed', pk, None) or ('changed', pk, [columns]) for main.tbl compared to
+	# name.tbl, in pk order within each chunk. progress(chunks done, chunks) gets called after each chunk.
+	# Stops (without an error) once cancelled() says so.
+	cuts = bounds(conn, tbl, pk, chunksize, intpk)
+	ranges = list(zip([None] + cuts, cuts + [None]))  # (lo, hi]: pk > lo AND pk <= hi. The open ends catch the other side's extra rows.
+	values = [f"iif(typeof({col}) = 'blob', hex({col}), {col})" for col in [pk] + cols]  # (json can't hold blobs)
+	serialized = f"json_array({', '.join(values)})"
+	for i, (lo, hi) in enumerate(ranges):
+		if cancelled and cancelled():
+			return
+		conds = ([f'{pk} > :lo'] if lo is not None else []) + ([f'{pk} <= :hi'] if hi is not None else [])
+		where = f"WHERE {' AND '.join(conds)}" if conds else ''
+		parms = {'lo': lo, 'hi': hi}
+		hashes = [conn.execute(f"SELECT tui_chunkhash(group_concat(r, char(30))) FROM (SELECT {serialized} AS r FROM {side}.{tbl} {where} ORDER BY {pk});", parms).fetchone()[0]
+			for side in ('main', name)]
+		if hashes[0] != hashes[1]:
+			new, old = ({row[0]: row[1:] for row in conn.execute(f"SELECT {pk}, {', '.join(cols)} FROM {side}.{tbl} {where} ORDER BY {pk};", parms)}
+				for side in ('main', name))
+			for key, row in new.items():
+				if key not in old:
+					yield 'added', key, None
+				elif row != old[key]:
+					yield 'changed', key, [col for col, a, b in zip(cols, row, old[key]) if a != b]
+			for key in old:
+				if key not in new:
+					yield 'removed', key, None
+		if progress:
+			progress(i + 1, len(ranges))
+
+if __name__ == "__main__":
+	import sqlite3
+	import sys
+	import tempfile
+	import time
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	old = tempfile.mktemp(suffix='.db')
+	conn = sqlite3.connect(old)
+	conn.execute('create table t (id integer primary key, name text, n integer)')
+	conn.executemany('insert into t values (?, ?, ?)', ((i, f'name{i}', i % 7) for i in range(n)))
+	conn.commit()
+	conn.close()
+	conn = sqlite3.connect(':memory:', uri=True)
+	conn.execute('create table t (id integer primary key, name text, n integer)')
+	conn.executemany('insert into t values (?, ?, ?)', ((i, f'name{i}', i % 7) for i in range(n)))
+	conn.execute('update t set name = ? where id = ?', ('changed', n // 2))
+	conn.execute('delete from t where id = 5')
+	conn.execute('insert into t values (?, ?, ?)', (n + 1, 'added', 0))
+	attach(conn, old)
+	start = time.perf_counter()
+	print(list(diff(conn, 't', 'id', columns(conn, 't')[1:], intpk=True)), f'{time.perf_counter() - start:.2f}s')
+	start = time.perf_counter()
+	print(list(diff(conn, 't', 'id', columns(conn, 't')[1:])), f'{time.perf_counter() - start:.2f}s (pk not known to be an integer)')
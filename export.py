@@ -0,0 +1,51 @@
+# Streaming export of query results (see exportrows in sqlite-tui3.py, and the command line mode). Rows are written
+# straight from the sqlite cursor a chunk at a time, so exporting millions of rows takes constant memory.
+# NULL is \N in TSV (as in postgres' COPY), empty in CSV and null in JSON lines. Blobs are written as hex.
+
+# Usage: formats, formatof, write
+
+import csv
+import json
+import os
+
+formats = {'.csv': 'csv', '.tsv': 'tsv', '.tab': 'tsv', '.txt': 'tsv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+def formatof(path):
+	# 'csv', 'tsv' or 'jsonl' going by path's extension, or None
+	return formats.get(os.path.splitext(path)[1].lower())
+
+def write(f, fmt, cursor, chunksize=1000, progress=None, cancelled=None):
+	# Write cursor's rows (after a header line for csv/tsv) to the text file f. progress(rows so far) gets called after
+	# each chunk. Returns the number of rows, or None if cancelled() said to stop.
+	columns = [column[0] for column in cursor.description]
+	if fmt == 'jsonl':
+		def out(rows):
+			f.writelines(json.dumps(dict(zip(columns, row)), default=bytes.hex) + '\n' for row in rows)
+	else:
+		writer = csv.writer(f, delimiter='\t' if fmt == 'tsv' else ',', lineterminator='\n')
+		writer.writerow(columns)
+		null = '\\N' if fmt == 'tsv' else ''
+
+		def out(rows):
+			writer.writerows([null if value is None else value.hex() if isinstance(value, bytes) else value for value in row] for row in rows)
+	done = 0
+	while True:
+		if cancelled and cancelled():
+			return None
+		rows = cursor.fetchmany(chunksize)
+		if not rows:
+			break
+		out(rows)
+		done += len(rows)
+		if progress:
+			progress(done)
+	return done
+
+if __name__ == "__main__":
+	import sqlite3
+	import sys
+	conn = sqlite3.connect(':memory:')
+	conn.execute('create table t (id integer primary key, name text, data blob)')
+	conn.executemany('insert into t (name, data) values (?, ?)', [(f'name{i}' if i % 3 else None, bytes([i])) for i in range(5)])
+	for fmt in ('csv', 'tsv', 'jsonl'):
+		print(write(sys.stdout, fmt, conn.execute('select * from t'), chunksize=2), 'rows')
@@ -0,0 +1,111 @@
+# Optional FTS5 full text index for instant find-next on big text-heavy tables (see ftssearch in sqlite-tui3.py).
+# The index lives in the sidecar file (attached as "tui"), so the user's db isn't modified. FTS5 external content
+# tables need their content table in the same db file as the index, so the index keeps its own copy of the text.
+# Edits made through our connection are logged to a temp table by temp triggers and applied before each search
+# (sync). Changes by other processes show up in PRAGMA data_version and mean a rebuild.
+
+# Usage: textcols, iscurrent, watch, markdirty, build, sync, search, scan, matchcols
+
+import heapq
+
+def name(tbl):
+	return f'fts_{tbl}'
+
+def textcols(types):
+	# Columns worth indexing, going by declared type (sqlite's own affinity rules, plus untyped columns)
+	return [col for col, dtype in types.items() if dtype == '' or 'CHAR' in dtype or 'CLOB' in dtype or 'TEXT' in dtype]
+
+# iscurrent and setstamp take the sidecar's own connection (sidecar.connect), the rest the db's with the sidecar attached
+
+def iscurrent(conn, tbl, schema, stamp, cols):
+	row = conn.execute("SELECT 1 FROM ftsindex WHERE tbl=? AND schema=? AND stamp=? AND cols=?", (tbl, schema, stamp, ' '.join(cols))).fetchone()
+	return row is not None
+
+def setstamp(conn, tbl, schema, stamp, cols):
+	conn.execute("INSERT OR REPLACE INTO ftsindex (tbl, schema, stamp, cols) VALUES (?, ?, ?, ?)", (tbl, schema, stamp, ' '.join(cols)))
+	conn.commit()
+
+def watch(conn, tbl):
+	# Log rowids changed through this connection. Temp triggers can't be seen by (or get in the way of) anyone else.
+	dirty = f'ftsdirty_{tbl}'
+	conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {dirty} (rid INTEGER PRIMARY KEY);")
+	conn.execute(f"CREATE TEMP TRIGGER IF NOT EXISTS {dirty}_i AFTER INSERT ON main.{tbl} BEGIN INSERT OR IGNORE INTO {dirty} VALUES (new.rowid); END;")
+	conn.execute(f"CREATE TEMP TRIGGER IF NOT EXISTS {dirty}_u AFTER UPDATE ON main.{tbl} BEGIN INSERT OR IGNORE INTO {dirty} VALUES (old.rowid); INSERT OR IGNORE INTO {dirty} VALUES (new.rowid); END;")
+	conn.execute(f"CREATE TEMP TRIGGER IF NOT EXISTS {dirty}_d AFTER DELETE ON main.{tbl} BEGIN INSERT OR IGNORE INTO {dirty} VALUES (old.rowid); END;")
+
+def markdirty(conn, tbl, rowids):
+	# For changes made through another connection (e.g. the write-behind writer), which the temp triggers can't see
+	conn.executemany(f"INSERT OR IGNORE INTO temp.ftsdirty_{tbl} VALUES (?);", [(rowid,) for rowid in rowids])
+	conn.commit()
+
+def build(conn, tbl, cols, batchsize=5000, progress=None, cancelled=None):
+	# Build into a new table and swap it in at the end, so a half built index is never searched. That also means each
+	# batch can be committed on its own, so the sidecar isn't locked (e.g. for the undo journal) for the whole build.
+	# conn must be its own connection (this runs in a worker thread) with the sidecar attached as tui.
+	# Returns False if cancelled.
+	fts = name(tbl)
+	conn.execute(f"DROP TABLE IF EXISTS tui.{fts}_new;")
+	conn.execute(f"CREATE VIRTUAL TABLE tui.{fts}_new USING fts5({', '.join(cols)});")
+	rows = conn.execute(f"SELECT rowid, {', '.join(cols)} FROM main.{tbl};")
+	insert = f"INSERT INTO tui.{fts}_new (rowid, {', '.join(cols)}) VALUES ({', '.join('?' * (len(cols) + 1))});"
+	conn.commit()
+	done = 0
+	while True:
+		if cancelled and cancelled():
+			conn.rollback()
+			conn.execute(f"DROP TABLE IF EXISTS tui.{fts}_new;")
+			conn.commit()
+			return False
+		batch = rows.fetchmany(batchsize)
+		if not batch:
+			break
+		conn.executemany(insert, batch)
+		conn.commit()
+		done += len(batch)
+		if progress:
+			progress(done)
+	conn.execute(f"DROP TABLE IF EXISTS tui.{fts};")
+	conn.execute(f"ALTER TABLE tui.{fts}_new RENAME TO {fts};")
+	conn.commit()
+	return True
+
+def sync(conn, tbl, cols):
+	# Re-index rows logged by watch() since the last sync. Usually a handful, so this is cheap.
+	fts = name(tbl)
+	dirty = f'temp.ftsdirty_{tbl}'
+	if conn.execute(f"SELECT 1 FROM {dirty} LIMIT 1;").fetchone() is None:
+		return
+	conn.execute(f"DELETE FROM tui.{fts} WHERE rowid IN (SELECT rid FROM {dirty});")
+	conn.execute(f"INSERT INTO tui.{fts} (rowid, {', '.join(cols)}) SELECT rowid, {', '.join(cols)} FROM main.{tbl} WHERE rowid IN (SELECT rid FROM {dirty});")
+	conn.execute(f"DELETE FROM {dirty};")
+	conn.commit()
+
+def query(text):
+	# Plain text from the search bar -> FTS5 prefix phrase query, i.e. tokens starting with what was typed
+	return '"' + text.replace('"', '""') + '" *'
+
+def search(conn, tbl, text, rowid, reverse=False):
+	# Next rowid after (or before) rowid with a match in any indexed column, or None
+	fts = name(tbl)
+	if rowid is None:
+		where = ''
+	else:
+		where = f"AND rowid {'<' if reverse else '>'} :rowid"
+	row = conn.execute(f"SELECT rowid FROM tui.{fts} WHERE {fts} MATCH :q {where} ORDER BY rowid {'DESC' if reverse else 'ASC'} LIMIT 1;", {'q': query(text), 'rowid': rowid}).fetchone()
+	return row[0] if row else None
+
+def scan(conn, tbl, cols, text, op, rowid):
+	# (rowid, column) of every match in rows with rowid <op> rowid, in rowid order. One query per column, merged.
+	fts = name(tbl)
+
+	def stream(col):
+		rows = conn.execute(f"SELECT rowid FROM tui.{fts} WHERE {fts} MATCH :q AND rowid {op} :rowid ORDER BY rowid;", {'q': f'{col} : {query(text)}', 'rowid': rowid})
+		for row in rows:
+			yield row[0], col
+
+	return heapq.merge(*[stream(col) for col in cols], key=lambda match: (match[0], cols.index(match[1])))
+
+def matchcols(conn, tbl, cols, text, rowid):
+	# Which of the indexed columns match in this row
+	fts = name(tbl)
+	return [col for col in cols if conn.execute(f"SELECT 1 FROM tui.{fts} WHERE {fts} MATCH :q AND rowid = :rowid;", {'q': f'{col} : {query(text)}', 'rowid': rowid}).fetchone()]
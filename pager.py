@@ -0,0 +1,161 @@
+# Keyset pagination over a sqlite table, so only a window of rows has to be in memory.
+# Pages are fetched by primary key (or rowid) range instead of OFFSET, so fetching
+# the last page of a 10M row table costs the same as fetching the first one.
+# With a sort column the key is (sort column, pk), so paging follows the sort, and a filter (an SQL
+# expression, see compilefilter) is ANDed onto every query. Both are done by sqlite, not on loaded rows.
+
+# Usage: first, last, after, before, around, keyset, where, sql, plan, compilefilter
+
+import re
+
+class Pager:
+	def __init__(self, conn, table, pkname, pagesize=200, view=False):
+		self.conn = conn
+		self.table = table
+		self.pkname = pkname
+		self.pagesize = pagesize
+		self.source = table  # what to SELECT rows FROM
+		if view:
+			# Views have no rowid (it's always NULL), so number the rows and page by that. Costs a scan up to the page.
+			self.source = f'(SELECT *, row_number() OVER () AS rowid FROM {table})'
+			self.select = f'SELECT * FROM {self.source}'
+		elif pkname == 'rowid':
+			# table has no primary key, so append rowid to the end (same as TableScreen.opentable)
+			self.select = f'SELECT *, rowid FROM {table}'
+		else:
+			self.select = f'SELECT * FROM {table}'
+		self.sortcol = None  # None = pk order
+		self.desc = False
+		self.filter = ''  # SQL expression rows have to match, with :f0, :f1... parameters in parms
+		self.parms = {}
+
+	@property
+	def pkorder(self):
+		# Rows come in ascending pk order (so e.g. a list of pks is in row order)
+		return self.sortcol is None and not self.desc
+
+	def orderby(self, reverse=False):
+		desc = self.desc != reverse
+		cols = [self.sortcol, self.pkname] if self.sortcol else [self.pkname]  # pk breaks ties, so the order is total
+		return ', '.join(f"{col} {'DESC' if desc else 'ASC'}" for col in cols)
+
+	def keyset(self, op, pk, conn=None, prefix='k'):
+		# SQL condition (and its parameters) for rows after ('>', '>=') or before ('<', '<=') the row with pk, in
+		# sort order. conn is for calling from another thread. prefix keeps parameters of two keysets apart.
+		if self.desc:
+			op = op.translate(str.maketrans('<>', '><'))
+		pk_, v_ = f':{prefix}pk', f':{prefix}v'
+		if self.sortcol is None:
+			return f'{self.pkname} {op} {pk_}', {f'{prefix}pk': pk}
+		row = (conn or self.conn).execute(f'SELECT {self.sortcol} FROM {self.source} WHERE {self.pkname} = ?', (pk,)).fetchone()
+		v = row[0] if row else None
+		s, p = self.sortcol, self.pkname
+		# NULLs sort first, and a row value with a NULL in it never compares true, so they need their own case
+		if v is None and op[0] == '>':
+			cond = f'({s} IS NULL AND {p} {op} {pk_} OR {s} IS NOT NULL)'
+		elif v is None:
+			cond = f'({s} IS NULL AND {p} {op} {pk_})'
+		elif op[0] == '>':
+			cond = f'({s}, {p}) {op} ({v_}, {pk_})'
+		else:
+			cond = f'({s} IS NULL OR ({s}, {p}) {op} ({v_}, {pk_}))'
+		return cond, {f'{prefix}pk': pk, f'{prefix}v': v}
+
+	def where(self, *conds):
+		# WHERE clause for the filter plus conds (SQL expressions), or '' if there are none
+		conds = [f'({cond})' for cond in (self.filter, *conds) if cond]
+		return f"WHERE {' AND '.join(conds)}" if conds else ''
+
+	def sql(self, *conds, reverse=False, columns=None):
+		# The whole (filtered, sorted) table, or just the rows matching conds. Parameters: self.parms + the conds'.
+		# columns: just these instead of all of them (plus rowid, see __init__)
+		select = f"SELECT {', '.join(columns)} FROM {self.source}" if columns else self.select
+		return f'{select} {self.where(*conds)} ORDER BY {self.orderby(reverse)}'
+
+	def fetch(self, cond='', parms={}, reverse=False):
+		rows = self.conn.execute(f'{self.sql(cond, reverse=reverse)} LIMIT :limit', {**self.parms, **parms, 'limit': self.pagesize}).fetchall()
+		if reverse:
+			rows.reverse()
+		return rows
+
+	def first(self):
+		return self.fetch()
+
+	def last(self):
+		return self.fetch(reverse=True)
+
+	def after(self, pk):
+		return self.fetch(*self.keyset('>', pk))
+
+	def before(self, pk):
+		return self.fetch(*self.keyset('<', pk), reverse=True)
+
+	def around(self, pk):
+		# Page starting at pk, for jumping straight to a row (e.g. a search hit). Grow it backward with before().
+		return self.fetch(*self.keyset('>=', pk))
+
+	def precedes(self, pk1, pk2):
+		# Does row pk1 come before row pk2?
+		cond, parms = self.keyset('<', pk2)
+		return self.conn.execute(f'SELECT 1 FROM {self.source} WHERE {self.pkname} = :pk1 AND {cond}', {**parms, 'pk1': pk1}).fetchone() is not None
+
+	def plan(self, conn=None):
+		# sqlite's plan for fetching a page, e.g. ['SCAN places', 'USE TEMP B-TREE FOR ORDER BY']
+		rows = (conn or self.conn).execute(f'EXPLAIN QUERY PLAN {self.sql()} LIMIT :limit', {**self.parms, 'limit': self.pagesize})
+		return [row[-1] for row in rows]
+
+filterops = {'=': '=', '==': '=', '!=': '!=', '<>': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>=', '~': 'REGEXP', '!~': 'NOT REGEXP',
+	'like': 'LIKE', 'glob': 'GLOB', 'is null': 'IS NULL', 'is not null': 'IS NOT NULL'}
+predicate = re.compile(r'^\s*(?:(\w+)\s*)?(is not null|is null|like|glob|==|!=|<>|<=|>=|!~|=|<|>|~)\s*(.*?)\s*$', re.IGNORECASE)
+
+def compilefilter(text, columns, defaultcol):
+	# 'name ~ ^a and visited = 1' -> ('(name REGEXP :f0) AND (visited = :f1)', {'f0': '^a', 'f1': 1}, [('name', 'REGEXP'), ...])
+	# Predicates without a column (e.g. '> 5') are on defaultcol. Values are bound, never pasted into the SQL.
+	# Raises ValueError for anything that doesn't parse.
+	conds = []
+	parms = {}
+	preds = []
+	for i, part in enumerate(re.split(r'\s+and\s+', text.strip(), flags=re.IGNORECASE)):
+		m = predicate.match(part)
+		if not m:
+			raise ValueError(f"Can't parse '{part}'")
+		col, op, value = m.group(1) or defaultcol, filterops[m.group(2).lower()], m.group(3)
+		if col not in columns:
+			raise ValueError(f'No column {col}')
+		if op in ('IS NULL', 'IS NOT NULL'):
+			if value:
+				raise ValueError(f"Can't parse '{part}'")
+			conds.append(f'{col} {op}')
+		else:
+			if len(value) >= 2 and value[0] == value[-1] and value[0] in '\'"':
+				value = value[1:-1]  # quoted, so it stays a string
+			else:
+				for convert in (int, float):
+					try:
+						value = convert(value)
+						break
+					except ValueError:
+						pass
+			conds.append(f'{col} {op} :f{i}')
+			parms[f'f{i}'] = value
+		preds.append((col, op))
+	return ' AND '.join(f'({cond})' for cond in conds), parms, preds
+
+if __name__ == "__main__":
+	import sqlite3
+	conn = sqlite3.connect(':memory:')
+	conn.execute('create table t (id integer primary key, name text)')
+	conn.executemany('insert into t (name) values (?)', [(f'name{i % 10}',) for i in range(1000)])
+	pager = Pager(conn, 't', 'id', pagesize=3)
+	print(pager.first())
+	print(pager.last())
+	print(pager.after(500))
+	print(pager.before(500))
+	pager.sortcol = 'name'
+	pager.filter, pager.parms, preds = compilefilter('id < 100', ['id', 'name'], 'name')
+	print(pager.first())
+	print(pager.after(pager.first()[-1][0]))
+	print(pager.plan())
+	conn.execute('create view v as select name from t where id % 100 = 0')
+	pager = Pager(conn, 'v', 'rowid', pagesize=3, view=True)
+	print(pager.after(5))
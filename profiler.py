@@ -0,0 +1,144 @@
+# Optional instrumentation (see profiling in sqlite-tui3.py): how long each SQL statement took and how many rows it
+# fetched, commit latency, and key press to paint latency. Connections opened with factory=Connection time their
+# statements while enabled. While disabled that's one flag check per execute, and cursors are plain sqlite3 ones.
+# Events go into a bounded buffer, which summary() aggregates for the profile screen and export() writes as JSON lines.
+# Counters (e.g. edit conflicts and lock retries) are kept whether enabled or not, since they cost next to nothing.
+
+# Usage: enabled, Connection, latency, note, count, counters, summary, export, clear
+
+import json
+import sqlite3
+import threading
+import time
+from collections import deque, Counter
+
+enabled = False
+events = deque(maxlen=20000)  # dicts, newest last. deque appends are thread safe, so workers can record too.
+counters = Counter()
+counterlock = threading.Lock()  # += on a Counter isn't atomic, and the writer thread counts too
+
+def record(kind, what, ms, rows=None):
+	event = {'t': time.time(), 'kind': kind, 'what': what, 'ms': ms, 'rows': rows, 'thread': threading.current_thread().name}
+	events.append(event)
+	return event
+
+class Cursor(sqlite3.Cursor):
+	# Adds fetch time and rows to its statement's event as they're fetched
+	event = None
+
+	def fetched(self, start, rows):
+		self.event['ms'] += (time.perf_counter() - start) * 1000
+		self.event['rows'] += rows
+
+	def fetchone(self):
+		start = time.perf_counter()
+		row = super().fetchone()
+		self.fetched(start, row is not None)
+		return row
+
+	def fetchmany(self, *args):
+		start = time.perf_counter()
+		rows = super().fetchmany(*args)
+		self.fetched(start, len(rows))
+		return rows
+
+	def fetchall(self):
+		start = time.perf_counter()
+		rows = super().fetchall()
+		self.fetched(start, len(rows))
+		return rows
+
+	def __next__(self):
+		start = time.perf_counter()
+		try:
+			row = super().__next__()
+		except StopIteration:
+			self.fetched(start, 0)
+			raise
+		self.fetched(start, 1)
+		return row
+
+class Connection(sqlite3.Connection):
+	def execute(self, sql, parms=()):
+		if not enabled:
+			return super().execute(sql, parms)
+		cur = self.cursor(Cursor)
+		start = time.perf_counter()
+		try:
+			cur.execute(sql, parms)
+		finally:
+			cur.event = record('sql', sql, (time.perf_counter() - start) * 1000, 0)
+		return cur
+
+	def executemany(self, sql, parms):
+		if not enabled:
+			return super().executemany(sql, parms)
+		start = time.perf_counter()
+		try:
+			return super().executemany(sql, parms)
+		finally:
+			record('sql', sql, (time.perf_counter() - start) * 1000)
+
+	def commit(self):
+		if not enabled:
+			return super().commit()
+		start = time.perf_counter()
+		try:
+			super().commit()
+		finally:
+			record('commit', 'commit', (time.perf_counter() - start) * 1000)
+
+def latency(what, start):
+	# Key press (at perf_counter() start) to paint, for an action like 'move'. Call once the screen has been painted.
+	if enabled and start is not None:
+		record('latency', what, (time.perf_counter() - start) * 1000)
+
+def note(text):
+	# Debug output that only costs anything while enabled (instead of a print in a hot path)
+	if enabled:
+		record('note', text, None)
+
+def count(name, n=1):
+	with counterlock:
+		counters[name] += n
+
+def summary():
+	# [(kind, what, count, total ms, max ms, rows)], biggest total first. Notes aren't summarized.
+	stats = {}
+	for event in list(events):
+		if event['kind'] == 'note':
+			continue
+		stat = stats.setdefault((event['kind'], event['what']), [0, 0.0, 0.0, 0])
+		stat[0] += 1
+		stat[1] += event['ms']
+		stat[2] = max(stat[2], event['ms'])
+		stat[3] += event['rows'] or 0
+	return sorted(((kind, what, *stat) for (kind, what), stat in stats.items()), key=lambda stat: -stat[3])
+
+def export(path):
+	# Append the events to path as JSON lines. Returns how many.
+	exported = list(events)
+	with open(path, 'a') as f:
+		for event in exported:
+			f.write(json.dumps(event, default=str) + '\n')
+		if counters:
+			f.write(json.dumps({'t': time.time(), 'kind': 'counters', 'counters': dict(counters)}) + '\n')
+	return len(exported)
+
+def clear():
+	events.clear()
+	with counterlock:
+		counters.clear()
+
+if __name__ == "__main__":
+	enabled = True
+	conn = sqlite3.connect(':memory:', factory=Connection)
+	conn.execute('create table t (id integer primary key, name text)')
+	conn.executemany('insert into t (name) values (?)', [(f'name{i}',) for i in range(10000)])
+	conn.commit()
+	for i in range(3):
+		conn.execute('select * from t where name like ?', (f'%{i}%',)).fetchall()
+	for row in conn.execute('select * from t limit 5'):
+		pass
+	for stat in summary():
+		print(stat)
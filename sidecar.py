@@ -0,0 +1,77 @@
+# Sidecar sqlite file next to the user's db (test.db -> test.db-tui) for things sqlite-tui remembers about
+# it between sessions, without writing to the db itself (it may be read-only or shared with other programs).
+
+import os
+import sqlite3
+import json
+
+schema = """
+CREATE TABLE IF NOT EXISTS profile (
+	tbl TEXT PRIMARY KEY,
+	schema TEXT,  -- table's CREATE statement, so an ALTER TABLE invalidates the profile
+	stamp TEXT,  -- see stamp()
+	stats TEXT  -- json: {column: {...}}
+);
+CREATE TABLE IF NOT EXISTS ftsindex (  -- see ftsindex.py. The index itself is in table fts_<tbl>.
+	tbl TEXT PRIMARY KEY,
+	schema TEXT,
+	stamp TEXT,
+	cols TEXT
+);
+CREATE TABLE IF NOT EXISTS history (  -- queries run in the SQL console (:), oldest first
+	id INTEGER PRIMARY KEY,
+	sql TEXT UNIQUE
+);
+"""
+
+def path(dbfile):
+	return f'{dbfile}-tui'
+
+def connect(dbfile):
+	# Other modules add their own tables (e.g. undostack.py)
+	try:
+		conn = sqlite3.connect(path(dbfile))
+		# Written on every edit (undo journal), so no fsync per commit. Losing the last few on a power cut is fine.
+		conn.execute("PRAGMA journal_mode=WAL;")
+		conn.execute("PRAGMA synchronous=NORMAL;")
+		conn.executescript(schema)
+	except sqlite3.OperationalError as e:
+		# e.g. read-only directory. Everything still works, it just isn't remembered next time.
+		print(f'sidecar: {e}')
+		conn = sqlite3.connect(':memory:')
+		conn.executescript(schema)
+	conn.row_factory = sqlite3.Row
+	return conn
+
+def stamp(dbfile):
+	# Cheap "has the db changed since last session" check. PRAGMA data_version would be nicer, but it's only
+	# comparable between calls on the same connection, so it can't tell us anything about a previous session.
+	# Any commit changes the -wal file (WAL mode) or the db file itself (rollback journal, or after a checkpoint).
+	parts = []
+	for fname in (dbfile, f'{dbfile}-wal'):
+		try:
+			st = os.stat(fname)
+			parts.append(f'{st.st_mtime_ns}:{st.st_size}')
+		except FileNotFoundError:
+			parts.append('-')
+	return ' '.join(parts)
+
+def getprofile(conn, tbl, tblschema, tblstamp):
+	row = conn.execute("SELECT stats FROM profile WHERE tbl=? AND schema=? AND stamp=?", (tbl, tblschema, tblstamp)).fetchone()
+	if row:
+		return json.loads(row['stats'])
+	return None
+
+def putprofile(conn, tbl, tblschema, tblstamp, stats):
+	conn.execute("INSERT OR REPLACE INTO profile (tbl, schema, stamp, stats) VALUES (?, ?, ?, ?)", (tbl, tblschema, tblstamp, json.dumps(stats)))
+	conn.commit()
+
+def addquery(conn, sql, keep=1000):
+	# Run again, it moves to the end instead of being there twice. Only the last keep are kept.
+	conn.execute("DELETE FROM history WHERE sql=?", (sql,))
+	conn.execute("INSERT INTO history (sql) VALUES (?)", (sql,))
+	conn.execute("DELETE FROM history WHERE id <= (SELECT max(id) FROM history) - ?", (keep,))
+	conn.commit()
+
+def queries(conn):
+	return [row['sql'] for row in conn.execute("SELECT sql FROM history ORDER BY id")]
@@ -4,44 +4,86 @@
 #   * textual console -x EVENT  # console that shows print's and other debugging info
 #   * textual run --dev sqlite-tui2a.py  # the actual program in dev mode (so it uses the console)
 #   * watch -d "sqlite3 ~/test.db 'select * from places;'"  # make sure the right changes go to right place in the db
-#   * watch -d "tail /tmp/sqlite-tui2-errors.log"  # watch for sqlite errors
+#   * watch -d "tail /tmp/sqlite-tui2-errors.log"  # watch for sqlite errors (see errorlog)
 
 import os
 import sys
 import sqlite3
 import time
+launched = time.perf_counter()  # see startuptimes
 import random
-from itertools import cycle
-import pyperclip
+from itertools import cycle, islice, accumulate
+from functools import lru_cache
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
 import re
+import csv
+import io
+import json
 
-from rich import inspect
 from rich.text import Text
+from rich.cells import cell_len
+from rich.style import Style
 from textual.app import App, ComposeResult
 from textual.containers import Vertical
 from textual.widgets import DataTable
+from textual.widgets.data_table import RowDoesNotExist, RowKey
 from textual.widgets import Static
 from textual.widgets import Footer
 from textual.widgets import TextArea
-from textual.widgets import MarkdownViewer
 from textual import events
-from rich.console import Console
+from textual import work
+from textual.worker import get_current_worker
 from textual.screen import Screen
+from textual.message import Message
 
 import undostack
+import pager
+import sidecar
+import ftsindex
+import writer
+import changelog
+import export
+import profiler
+import dbconn
+import dbdiff
 
 help_text = """
 # sqlite-tui2a.py
 
 ## Features
 - Undo/redo
-- Search
+- Search (n/N for next/previous match, wraps around, escape cancels). Matches are counted and highlighted.
 - Edit cell contents
 - Toggle boolean cell
 - Vim-like movement (with count)
-- Yank to clipboard
+- Visual mode (v): select a range of cells, rows or columns, then toggle (space), set (e), clear (x) or paste (p) all of it at once
+- Yank to clipboard (y): the cell, row or column under the cursor (c switches), or the visual mode selection
+- Export (W): the table as filtered and sorted to a .csv, .tsv or .jsonl file, in the background (escape stops it)
+- Import (R): rows from a .csv or .tsv file (header line optional), inserted, or updated if their pk is there already.
+  p outside visual mode does the same with the clipboard's lines. Either one is a single undo step.
 	- Paste in edit-cell mode with ctrl-shift-v
-- Status bar
+- Diff (D) against another copy of the db (e.g. a backup): added rows and changed cells are highlighted, n/N go through
+  them in pk order, and removed rows are counted in the status bar. Compared in chunks by hash, so it's fast on big tables.
+- Status bar. i shows stats for the cursor's column there: rows, distinct, nulls, min/max, sum/avg and the most common
+  values, of the filtered rows. Counted by sqlite in the background and cached until the column changes.
+- Virtual rows: only a window around the cursor is loaded, so huge tables open instantly
+- Long TEXT and BLOB values are only loaded as a preview (previewsize). Editing a cell fetches its whole value.
+- Connection profiles (connprofile, or --profile on the command line): mmap and a bigger cache for huge dbs, or read-only
+  and immutable opens for snapshots and dbs on network or archival storage
+- Changes made by other programs show up without restarting. An edit of a cell another program changed since is not
+  saved (L reloads the rows), and a db another program has locked gets waited for in the background, not in the UI.
+  The profiler (P) counts both.
+- Profiler (P): time spent per SQL statement, rows fetched, commit latency and key press to paint latency. space there
+  turns recording on/off, c clears, w appends it all to profilelog as JSON lines.
+- Command line mode (`sqlite-tui3.py test.db --help`): print filtered/searched rows as TSV, or apply a file of edits, which u
+  in the TUI then undoes
+- SQL console (:): any query on the db (read only), with elapsed time and row count. Rows are streamed in a page at a
+  time, escape stops a long query, and ctrl+up/ctrl+down recall earlier queries (kept in the sidecar file).
+- Table picker (t): every table and view in the db, with row estimates. Switching back to a table picks up where you left it.
+- Sort (s: by the cursor's column, again for descending, again for unsorted) and filter (f, e.g. `name ~ ^a and visited = 1`,
+  or just `> 5` for the cursor's column). Done by sqlite, so they work on huge tables. If that means a full scan or a sort for
+  every page, the status bar says so, and I creates an index for it.
 
 ## Keybindings
 ### Movement
@@ -61,6 +103,166 @@ sqlite-tui3.py - replace modalscreen with modes, put sqlite stuff into class, re
 dbfname = 'test.db'  # located at ~/ just for testing sqlite-tui. Del when done.
 dbtable = 'places'
 
+virtualrows = True  # Only keep a window of rows around the cursor in memory (see pager.py). False loads the whole table at startup.
+pagesize = 200  # rows per page fetched by the pager
+maxpages = 5  # pages kept in memory. The ones furthest from the cursor get evicted past this.
+widthsample = 100  # rows sampled for column widths when a table opens. Values wider than their column end in …. 0 = size columns to fit every loaded row (slow for wide values).
+maxcolwidth = 40  # widest a column gets from the sample or an edit (None = no limit)
+previewsize = 200  # TEXT longer than this is only loaded (and shown) cut off, BLOBs just as <blob 12.3 KB>. None = no limit.
+stattop = 3  # most common values the column stats (i) show
+queryrows = 10000  # rows the SQL console (:) shows of a result. The rest are only counted.
+querypage = 500  # rows the console fetches (and shows) at a time
+queryprogress = 1000  # sqlite instructions between the console's progress handler calls (how soon escape stops a query)
+maxhistory = 1000  # console queries remembered in the sidecar file (ctrl+up/ctrl+down recall them)
+profilesample = None  # Only profile (e.g. look for boolean columns in) this many rows. None for the whole table.
+searchmode = 'regexp'  # 'regexp', 'like' (case-insensitive substring) or 'glob' (case-sensitive substring)
+searchwrap = True  # n/N wrap around at the end/start of the table
+maxmatches = 100000  # matches kept for n/N and highlighting. Past this they're only counted, and n/N query instead.
+matchstyle = Style(bgcolor='dark_orange3')
+selectstyle = Style(bgcolor='purple4')
+addedstyle = Style(bgcolor='dark_green')  # diff (D): rows the other db doesn't have
+changedstyle = Style(bgcolor='blue3')  # and cells that are different there
+diffchunk = 10000  # rows per chunk the diff hashes on both sides (see dbdiff.py)
+maxdiffs = 100000  # changed/added rows kept for highlighting and n/N. Past this they're only counted.
+ftssearch = False  # Search with an FTS5 index (kept in the sidecar file) instead. Built in the background on first use.
+writebehind = False  # Edits show right away and get committed in batches by a writer thread (see writer.py). ctrl+s commits now.
+writedelay = 0.5  # seconds a write-behind batch waits for more edits before committing
+writebatch = 500  # max edits per write-behind batch
+busytimeout = 200  # ms an edit waits for another program's write lock before it's handed to a writer thread instead (see changecell)
+lockretries = 5  # times a writer thread retries a locked db, waiting lockbackoff seconds, then twice that, and so on
+lockbackoff = 0.1
+loadbatch = 1000  # rows per batch when loading the whole table in the background (virtualrows = False)
+importbatch = 5000  # rows per transaction when importing (R, or p outside visual mode)
+pollinterval = 1.0  # seconds between checks for changes by other programs (0 = don't check)
+logchanges = False  # Log changed pks with triggers in the db itself, so a refresh only re-reads those (see changelog.py)
+maxtables = 8  # tables whose window (loaded pages, cursor, sort and filter) is kept when switching to another (t)
+maxundo = 100000  # cells remembered by the undo journal (kept in the sidecar file, so undo works across sessions)
+profiling = False  # Record SQL statement timings and key press to paint latency from the start (P shows them, see profiler.py)
+profilelog = '/tmp/sqlite-tui-profile.jsonl'  # where w on the profiler screen exports to
+errorlog = '/tmp/sqlite-tui2-errors.log'  # failed db writes go here
+startuptimes = False  # print how long startup's phases took (imports, finding the db, schema, first paint...) on exit
+edittheme = 'github_light'  # cell editor's theme, set when it first opens: {'dracula', 'vscode_dark', 'monokai', 'github_light', 'css'}  # Only good ones: monokai, github_light
+connprofile = 'default'  # how the db gets opened, see dbconn.profiles. 'large' for big dbs, 'readonly' or 'snapshot' to never write to it.
+
+# X REGEXP Y calls regexp(Y, X)
+@lru_cache(maxsize=16)
+def compileregex(pattern):
+	return re.compile(pattern)
+
+def regexp(pattern, value):
+	if value is None:
+		return False
+	return compileregex(pattern).search(str(value)) is not None
+
+def cellwidth(value):
+	# Width of value in a DataTable cell (see textual's default_cell_formatter). Rows are one line high.
+	if value is None:
+		return 0
+	if isinstance(value, float):
+		return len(f'{value:.2f}')
+	return cell_len(str(value).split('\n', 1)[0])
+
+def preview(value):
+	# What a cell holds for value: past previewsize, the start of a TEXT and the size of a BLOB. e fetches the whole
+	# value (see cellvalue), and search, yank and export work on the db, so they see it anyway.
+	if previewsize is None or not isinstance(value, (str, bytes)) or len(value) <= previewsize:
+		return value
+	if isinstance(value, str):
+		return value[:previewsize] + '…'
+	size = len(value)
+	for unit in ('B', 'KB', 'MB'):
+		if size < 1024 or unit == 'MB':
+			break
+		size /= 1024
+	return f'<blob {size:.1f} {unit}>' if unit != 'B' else f'<blob {size} B>'
+
+def searchop(text):
+	# SQL operator and pattern for searching cells for text, going by searchmode
+	if searchmode == 'regexp':
+		return 'REGEXP', text
+	elif searchmode == 'glob':
+		return 'GLOB', f'*{text}*'
+	else:
+		return 'LIKE', f'%{text}%'
+
+def primarykey(conn, tbl):
+	pk = conn.execute("select name from pragma_table_info(?) where pk=1", (tbl,))  # {'cid': 8, 'name': 'pk', 'type': 'INTEGER', 'notnull': 0, 'dflt_value': None, 'pk': 1}
+	pk = pk.fetchone()  # just use first primary key if more than one
+	if pk:
+		return pk[0]
+	else:
+		# no primary key, so go by rowid
+		return 'rowid'
+
+def profilecolumns(conn, side, tbl, tblschema, dbstamp, headers, types, pkname):
+	# Column stats in one pass over the table (or the first profilesample rows), instead of a min/max
+	# scan per column. Cached in the sidecar (side) until the table's schema or the db file changes.
+	stats = sidecar.getprofile(side, tbl, tblschema, dbstamp)
+	if stats is not None:
+		return stats
+	stats = {}
+	exprs = []
+	scanned = []
+	for field in headers:
+		dtype = types[field]
+		if field == pkname:
+			stats[field] = {'bool': False}
+		elif 'BOOL' in dtype:
+			stats[field] = {'bool': True}  # declared boolean, no need to look
+		elif 'BLOB' in dtype or 'REAL' in dtype or 'FLOA' in dtype or 'DOUB' in dtype:
+			stats[field] = {'bool': False}  # can't be one
+		else:
+			# nonbool counts values that are anything but 0 or 1 (stored as integers or as strings)
+			exprs.append(f"count({field}), min({field}), max({field}), sum({field} NOT IN (0, 1, '0', '1'))")
+			scanned.append(field)
+	if scanned:
+		source = tbl if profilesample is None else f'(SELECT * FROM {tbl} LIMIT {int(profilesample)})'
+		result = conn.execute(f"SELECT count(*), {', '.join(exprs)} FROM {source};").fetchone()
+		nrows = result[0]
+		for i, field in enumerate(scanned):
+			count, mn, mx, nonbool = result[1 + i*4:5 + i*4]
+			# Assume boolean if it has only 0 and 1 values (both of them), nothing else
+			isbool = nonbool == 0 and str(mn) == '0' and str(mx) == '1'
+			stats[field] = {'bool': isbool, 'nulls': nrows - count}
+			if not isinstance(mn, bytes) and not isinstance(mx, bytes):
+				stats[field].update({'min': mn, 'max': mx})
+	sidecar.putprofile(side, tbl, tblschema, dbstamp, stats)
+	return stats
+
+def columnstats(conn, pg, col, top=3):
+	# Aggregates for column col of the rows pg (a Pager) shows, i.e. with its filter: one scan for all the counts,
+	# min/max and sum/avg (of the numbers only), and a GROUP BY for the top most common values.
+	num = f"CASE WHEN typeof({col}) IN ('integer', 'real') THEN {col} END"
+	row = conn.execute(f"SELECT count(*), count({col}), count(DISTINCT {col}), min({col}), max({col}), count({num}), sum({num}), avg({num}) FROM {pg.source} {pg.where()};", pg.parms).fetchone()
+	stats = dict(zip(('rows', 'values', 'distinct', 'min', 'max', 'numbers', 'sum', 'avg'), row))
+	stats['nulls'] = stats['rows'] - stats['values']
+	stats['top'] = []
+	if top and stats['distinct'] < stats['values']:  # (all unique: every count would be 1)
+		stats['top'] = conn.execute(f"SELECT {col}, count(*) FROM {pg.source} {pg.where(f'{col} IS NOT NULL')} GROUP BY {col} ORDER BY count(*) DESC LIMIT :top;", {**pg.parms, 'top': top}).fetchall()
+	return stats
+
+def logerror(error, sql, parms):
+	profiler.note(error)
+	with open(errorlog, 'a') as f:
+		f.write(f'{error}\n')
+		f.write(f'{sql}, {parms}')
+
+# Startup timing. Each phase is the time since the one before, and also goes to the profiler (P shows it).
+phases = []
+phasestart = launched
+
+def phase(name):
+	global phasestart
+	now = time.perf_counter()
+	phases.append((name, (now - phasestart) * 1000))
+	profiler.record('startup', name, phases[-1][1])
+	phasestart = now
+
+def clipboard():
+	# pyperclip, imported on first yank or paste. Most sessions never use the clipboard.
+	import pyperclip
+	return pyperclip
+
 class HelpScreen(Screen):
 	BINDINGS = [("escape", "switch_mode('table')", "Exit Help"),]
 
@@ -70,11 +272,74 @@ class HelpScreen(Screen):
 	def compose(self) -> ComposeResult:
 		#yield Static(" Windows ", id="title")
 		#yield Static(help_text)
+		from textual.widgets import MarkdownViewer  # (markdown-it and all, only once help is opened)
 		yield MarkdownViewer(help_text)
 		#yield Static("Press any key to continue [blink]_[/]", id="any-key")
 
+class MatchTable(DataTable):
+	"""A DataTable that highlights search matches and the visual mode selection."""
+	highlights = set()  # (pk, column#) of matched cells
+	selection = None  # (first row#, last row#, first column#, last column#). row#s are None for whole columns. See showselection.
+	diffs = {}  # style of (pk, column#) of changed cells and (pk, None) of added rows. See TableScreen.showdiff.
+	colx = None  # x of each column and of the end of the last one (prefix sum of their widths). None while DataTable sizes them.
+
+	def fixwidths(self):
+		# Columns have fixed widths (see TableScreen.addcolumns). Call again whenever one changes.
+		self.colx = list(accumulate((column.get_render_width(self) for column in self.ordered_columns), initial=0))
+
+	def columnx(self, col):
+		# (x, width) of column# col, e.g. for putting the cell editor over a cell
+		if self.colx is None:
+			widths = [column.get_render_width(self) for column in self.ordered_columns]
+			return sum(widths[:col]), widths[col]
+		return self.colx[col], self.colx[col + 1] - self.colx[col]
+
+	def widen(self, col, value):
+		# Make fixed width column# col wide enough for value (up to maxcolwidth), e.g. after an edit
+		if self.colx is None:
+			return
+		column = self.ordered_columns[col]
+		width = min(cellwidth(value), maxcolwidth or cellwidth(value))
+		if width > column.width:
+			column.width = width
+			self.fixwidths()
+			self._require_update_dimensions = True
+			self.check_idle()
+
+	def _update_dimensions(self, new_rows):
+		if self.colx is not None:
+			new_rows = []  # nothing to measure them for, widths are fixed and rows one line high
+		super()._update_dimensions(new_rows)
+
+	def _compute_row_renderables(self, row_index):
+		renderables = super()._compute_row_renderables(row_index)
+		for cell in renderables.cells:
+			if isinstance(cell, Text):
+				cell.overflow = 'ellipsis'  # instead of just cutting off values wider than their (fixed width) column
+		return renderables
+
+	def _render_cell(self, row_index, column_index, base_style, width, cursor=False, hover=False):
+		if (self.highlights or self.selection or self.diffs) and row_index >= 0 and column_index >= 0:
+			# base_style is part of the render cache key, so these cache fine
+			pk = self._row_locations.get_key(row_index).value
+			if self.diffs:
+				style = self.diffs.get((pk, column_index)) or self.diffs.get((pk, None))
+				if style:
+					base_style += style
+			if (pk, column_index) in self.highlights:
+				base_style += matchstyle
+			if self.selection:
+				r0, r1, c0, c1 = self.selection
+				if c0 <= column_index <= c1 and (r0 is None or r0 <= row_index <= r1):
+					base_style += selectstyle
+		return super()._render_cell(row_index, column_index, base_style, width, cursor, hover)
+
 class TextAreaSearch(TextArea):
 	"""A subclass of TextArea to be used for search bar input."""
+	searched = ''  # text the match list is for
+	matches = []  # (pk, column#) of every match in row order (up to maxmatches), filled in by findall
+	matchcount = 0
+	matchesdone = False  # matches is complete, so n/N can just jump through it
 
 	def _on_key(self, event: events.Key) -> None:
 		if event.character == "(":
@@ -86,46 +351,234 @@ class TextAreaSearch(TextArea):
 			self.search()
 		elif event.key == "escape":
 			self.display = False
+			self.cancel()
+
+	def cancel(self):
+		if self.workers.cancel_group(self, 'search'):
+			self.screen.query_one('#statusbar').update(f"Search for '{self.searched}' cancelled")
 
 	def search(self):
-		table = app.query_one(DataTable)
+		# Enter in the search bar: jump to the next match, and collect all of them (for the count, n/N and highlighting).
+		# Runs in the background, so a slow search never locks up the app. escape cancels it.
+		screen = self.screen
+		table = screen.query_one(DataTable)
 		self.display = False
-		cur_row = table.cursor_coordinate.row
-		cur_col = table.cursor_coordinate.column
-		cur_col += 1  # don't search current cell. Start search from one ahead
-		lastrow = table.row_count - 1
-		lastcol = len(table.columns) - 1
-		print(f'lr: {lastrow}, lc: {lastcol}')
-		if cur_col > lastcol:
-			cur_col = 0
-			cur_row += 1
-		if cur_row > lastrow:
-			# searched from last col in last row. This is equivalent to no search at all
-			return
-		result = None
-		for row in range(cur_row, lastrow):  # TODO: wrap on/off, reverse. Currently on searches from current position to end. Also TODO: not "stall" with massive amounts of data
-			print(f'r: {row}')
-			for col in range(cur_col, lastcol):
-				print(f'c: {col} ({self.headers[col]})')
-				cell = table.get_cell_at((row, col))
-				result = re.search(rf'^.*{self.text.strip()}.*$', cell)  # seems a CR gets added after first search, so hitting 'n' made it search for the CR too and come up empty
-				if col >= 0:
-					print(f'searching for {self.text} in {cell}, {result}')
-				else:
-					#print(cell)
-					pass
-				if result:
-					table.move_cursor(row=row, column=col)
-					break
-			if result:
-				break
 		table.focus()
+		text = self.text.strip()  # seems a CR gets added after first search, so hitting 'n' made it search for the CR too and come up empty
+		if text == '' or table.row_count == 0 or not self.validate(text):
+			return
+		self.searched = text
+		self.matches = []
+		self.matchcount = 0
+		self.matchesdone = False
+		table.highlights = set()
+		table.refresh()
+		cur_pk = table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value
+		self.findall(text, cur_pk, table.cursor_coordinate.column, ftssearch and screen.ftsready())
+
+	def findnext(self, reverse=False):
+		# n/N: straight from the match list if it's complete, else one query in the background
+		screen = self.screen
+		table = screen.query_one(DataTable)
+		text = self.text.strip()
+		if text == '' or table.row_count == 0 or not self.validate(text):
+			return
+		cur = (table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value, table.cursor_coordinate.column)
+		if text != self.searched or not self.matchesdone:
+			self.findone(text, *cur, reverse, ftssearch and screen.ftsready())
+			return
+		if not self.matches:
+			screen.notify(f'Pattern not found: {text}')
+			return
+		if reverse:
+			i = bisect_left(self.matches, cur) - 1
+		else:
+			i = bisect_right(self.matches, cur)
+		if i < 0 or i >= len(self.matches):
+			if not searchwrap:
+				screen.notify(f'Pattern not found: {text}')
+				return
+			i %= len(self.matches)
+			screen.notify('Search hit TOP, continuing at BOTTOM' if reverse else 'Search hit BOTTOM, continuing at TOP')
+		screen.gotopk(*self.matches[i])
+		screen.query_one('#statusbar').update(f"'{text}': match {i + 1}/{self.matchcount}")
+
+	def validate(self, text):
+		if searchmode == 'regexp' and not ftssearch:
+			try:
+				re.compile(text)
+			except re.error as e:
+				self.screen.notify(f'Bad regex: {e}')
+				return False
+		return True
+
+	def matcher(self, conn, text, fts):
+		# Search functions for the current search mode, running on conn (a worker's own connection):
+		#   matchcols(pk): column numbers of the cells in that row that match
+		#   findrow(frompk, reverse): first matching row after (before if reverse) frompk, or from the start (end) if frompk is None
+		#   scan(op, pk): (pk, column#) of every match in rows <op> pk's row, in row order
+		# The SQL versions run the search as a query in row order (see pager), so "find next" is one query instead of a
+		# python loop over every cell, and they find rows that aren't loaded into the DataTable (see virtualrows).
+		screen = self.screen
+		headers = screen.headers
+		pager = screen.pager
+		if fts and pager.pkorder and not pager.filter:
+			# FTS index: matches tokens starting with text instead of going by searchmode. rowid is the pk (see openfts).
+			# Only in pk order without a filter, since the index knows nothing about either.
+			def matchcols(rowpk):
+				return [headers.index(col) for col in ftsindex.matchcols(conn, dbtable, screen.ftscols, text, rowpk)]
+
+			def findrow(frompk, reverse):
+				return ftsindex.search(conn, dbtable, text, frompk, reverse)
+
+			def scan(op, frompk):
+				for rowid, col in ftsindex.scan(conn, dbtable, screen.ftscols, text, op, frompk):
+					yield rowid, headers.index(col)
+
+			return matchcols, findrow, scan
+
+		op, pattern = searchop(text)
+		pk = screen.pkname
+		matches = [f'{col} {op} :p' for col in headers]
+
+		def matchcols(rowpk):
+			flags = conn.execute(f"SELECT {', '.join(matches)} FROM {pager.source} WHERE {pk} = :pk;", {'p': pattern, 'pk': rowpk}).fetchone()
+			return [col for col, flag in enumerate(flags) if flag]
+
+		def findrow(frompk, reverse):
+			cond, parms = ('', {}) if frompk is None else pager.keyset('<' if reverse else '>', frompk, conn)
+			row = conn.execute(f"SELECT {pk} FROM {pager.source} {pager.where(cond, ' OR '.join(matches))} ORDER BY {pager.orderby(reverse)} LIMIT 1;", {**pager.parms, **parms, 'p': pattern}).fetchone()
+			return row[0] if row else None
+
+		def scan(op, frompk):
+			cond, parms = pager.keyset(op, frompk, conn)
+			rows = conn.execute(f"SELECT {pk}, {', '.join(matches)} FROM {pager.source} {pager.where(cond, ' OR '.join(matches))} ORDER BY {pager.orderby()};", {**pager.parms, **parms, 'p': pattern})
+			for row in rows:
+				for col, flag in enumerate(row[1:]):
+					if flag:
+						yield row[0], col
+
+		return matchcols, findrow, scan
+
+	@work(thread=True, exclusive=True, group='search')
+	def findone(self, text, cur_pk, cur_col, reverse, fts):
+		worker = get_current_worker()
+		screen = self.screen
+		conn = screen.connect(worker, fts)
+		matchcols, findrow, scan = self.matcher(conn, text, fts)
+		try:
+			# Rest of the current row first (don't search current cell. Start search from one ahead)
+			cols = [col for col in matchcols(cur_pk) if (col < cur_col if reverse else col > cur_col)]
+			if cols:
+				foundpk = cur_pk
+			else:
+				foundpk = findrow(cur_pk, reverse)
+				if foundpk is None and searchwrap:
+					foundpk = findrow(None, reverse)
+					if foundpk is not None:
+						app.call_from_thread(screen.notify, 'Search hit TOP, continuing at BOTTOM' if reverse else 'Search hit BOTTOM, continuing at TOP')
+				if foundpk is None:
+					app.call_from_thread(screen.notify, f'Pattern not found: {text}')
+					return
+				cols = matchcols(foundpk)
+		except sqlite3.OperationalError:
+			return  # interrupted by cancel (see connect)
+		finally:
+			conn.close()
+		app.call_from_thread(screen.gotopk, foundpk, cols[-1] if reverse else cols[0])
+
+	@work(thread=True, exclusive=True, group='search')
+	def findall(self, text, cur_pk, cur_col, fts):
+		# Scan from the cursor to the end first, so the first jump doesn't wait for the whole table, then wrap around
+		worker = get_current_worker()
+		screen = self.screen
+		table = screen.query_one(DataTable)
+		statusbar = screen.query_one('#statusbar')
+		conn = screen.connect(worker, fts)
+		matchcols, findrow, scan = self.matcher(conn, text, fts)
+		app.call_from_thread(setattr, statusbar, 'display', True)
+		found = []  # batch not handed to the UI yet
+		segments = {'>=': [], '<': []}
+		jumped = False
+		count = 0
+
+		def flush():
+			table.highlights.update(found)
+			table.refresh()
+			statusbar.update(f"Searching for '{text}': {count} matches so far")
+
+		try:
+			for op in ('>=', '<'):
+				for match in scan(op, cur_pk):
+					count += 1
+					if count <= maxmatches:
+						segments[op].append(match)
+						found.append(match)
+					if not jumped and ((op == '<' and searchwrap) or match[0] != cur_pk or match[1] > cur_col):
+						jumped = True
+						app.call_from_thread(screen.gotopk, *match)
+					if len(found) >= 1000:
+						app.call_from_thread(flush)
+						found = []
+		except sqlite3.OperationalError:
+			return  # interrupted by cancel (see connect)
+		finally:
+			conn.close()
+		if not jumped and count:
+			# Only match is the current cell
+			app.call_from_thread(screen.gotopk, *segments['>='][0])
+		app.call_from_thread(self.foundall, text, segments['<'] + segments['>='], count, found)
+
+	def foundall(self, text, matches, count, found):
+		table = self.screen.query_one(DataTable)
+		statusbar = self.screen.query_one('#statusbar')
+		table.highlights.update(found)
+		table.refresh()
+		self.matches = matches
+		self.matchcount = count
+		self.matchesdone = count <= maxmatches and self.screen.pager.pkorder  # else n/N fall back to querying (matches are bisected by pk)
+		if count == 0:
+			statusbar.update(f'Pattern not found: {text}')
+		elif count > maxmatches:
+			statusbar.update(f"'{text}': {count} matches (first {maxmatches} highlighted)")
+		else:
+			statusbar.update(f"'{text}': {count} matches")
+
+class TextAreaFilter(TextArea):
+	"""A subclass of TextArea for the filter bar (see TableScreen.setfilter)."""
+
+	def _on_key(self, event: events.Key) -> None:
+		if event.key == "enter":
+			event.prevent_default()  # no newline
+			event.stop()  # the screen's _on_key would clear notifications, e.g. a bad filter's
+			self.display = False
+			self.screen.query_one(DataTable).focus()
+			self.screen.setfilter(self.text.strip())
+		elif event.key == "escape":
+			self.display = False
+			self.screen.query_one(DataTable).focus()
+
+class TextAreaFile(TextArea):
+	"""A subclass of TextArea for a file name to export to or import from (see TableScreen.filebar)."""
+	onenter = None  # gets called with the file name
+
+	def _on_key(self, event: events.Key) -> None:
+		if event.key == "enter":
+			event.prevent_default()
+			event.stop()  # so the notifications don't get cleared
+			self.display = False
+			self.screen.query_one(DataTable).focus()
+			if self.text.strip():
+				self.onenter(self.text.strip())
+		elif event.key == "escape":
+			self.display = False
+			self.screen.query_one(DataTable).focus()
 
 class TextAreaInput(TextArea):
 	"""A subclass of TextArea to be used like an advanced Input for cell updating."""
 
 	def _on_key(self, event: events.Key) -> None:
-		print(event)  # Key(key='enter', character='\r', name='enter', is_printable=False, aliases=['enter', 'ctrl+m'])
+		profiler.note(event)  # Key(key='enter', character='\r', name='enter', is_printable=False, aliases=['enter', 'ctrl+m'])
 		#table = self.query_one(DataTable)  # no nodes match, I think cuz self is the textarea
 		#table = app.query_one(DataTable)  # works, but don't need
 		if event.character == "(":
@@ -134,14 +587,14 @@ class TextAreaInput(TextArea):
 			self.move_cursor_relative(columns=-1)
 			event.prevent_default()
 		elif event.key == "enter":
-			app.on_input_submitted()
+			self.screen.on_input_submitted()
 		elif event.key == "escape":
 			self.display = False
 		elif event.key == "down":
-			app.on_input_submitted()
+			self.screen.on_input_submitted()
 			#app.action_movecur(1, 0)
 		elif event.key == "up":
-			app.on_input_submitted()
+			self.screen.on_input_submitted()
 			#app.action_movecur(-1, 0)
 		#elif event.key == "left":  # can't trap these keys as user might use them to go left/right in the textarea. Duh!
 		#	app.on_input_submitted()
@@ -157,14 +610,14 @@ class TableScreen(Screen):
 	status = ''
 	pki = None  # primary key index (i.e. column #). Prolly a better way to do this now that I set the rowkey in add_row to the rowid, but pki is used in conjunction with pkname to find the row in the db table
 	cursors = cycle(["cell", "column", "row"])
-	undos = undostack.Stack()
+	visual = None  # (pk, column#) where visual mode started, i.e. the other corner of the selection
 
 	CSS_PATH = "layers.tcss"
 
 	# Third way to capture keystrokes besides BINDINGS and self.key_X()'s
 	def _on_key(self, event: events.Key) -> None:
 		app.clear_notifications()
-		print(event)
+		profiler.note(event)
 		if event.key in ['g', 'G', 'circumflex_accent', 'dollar_sign', '0', 'ctrl+f', 'ctrl+b']:
 			self.jumpcur(event.key)
 		elif event.key =='y':
@@ -172,17 +625,47 @@ class TableScreen(Screen):
 		elif event.key =='slash':
 			self.searchbar()
 		elif event.key =='i':
-			statusbar = self.query_one('#statusbar')
-			statusbar.update('hi there!')
-			if statusbar.display == False:
-				statusbar.display = True
-			else:
-				statusbar.display = False
-		elif event.key =='n':
+			self.togglestats()
+		elif (event.key =='n' or event.key == 'N') and self.diffpks:
+			self.nextdiff(reverse=event.key == 'N')
+		elif event.key =='n' or event.key == 'N':
 			searchbar = self.query_one(TextAreaSearch)
 			if searchbar.text != '':
 				# Re-use text in invisible searchbar
-				searchbar.search()
+				searchbar.findnext(reverse=event.key == 'N')
+		elif event.key == 'escape':
+			self.query_one(TextAreaSearch).cancel()
+			self.workers.cancel_group(self, 'export')
+			self.workers.cancel_group(self, 'import')
+			self.workers.cancel_group(self, 'diff')
+			if self.diffpks:
+				self.cleardiff()
+			if self.visual:
+				self.togglevisual()
+		elif event.key == 'v':
+			self.togglevisual()
+		elif event.key == 'x' and self.visual:
+			self.changerange('clear')
+		elif event.key == 'p' and self.visual:
+			text = self.paste()
+			if text is not None:
+				self.changerange('paste', text)
+		elif event.key == 'p':
+			self.put()
+		elif event.key == 's':
+			self.sortby()
+		elif event.key == 'f':
+			self.filterbar()
+		elif event.key == 'W':
+			self.filebar(self.exportrows)
+		elif event.key == 'R':
+			self.filebar(self.startimport)
+		elif event.key == 'D':
+			self.filebar(self.startdiff, self.dbfile)
+		elif event.key == 'I' and self.indexcols and not self.readonly():
+			self.createindex(self.indexcols)
+		elif event.key == 'L' and self.conflictpk is not None:
+			self.reloadrows()
 
 	# There are 3 ways to capture keystrokes in this class. This is only one of them.
 	BINDINGS = [
@@ -201,7 +684,11 @@ class TableScreen(Screen):
 		#("enter", "getvalue()", "call value if cursor==cell, row num, column label"),	# enter already bound
 		("space", "togglecurcell", "if current cell is a (0,1) boolean, toggle it"),
 		("u", "undo", "undo"),
+		("ctrl+s", "save", "commit write-behind edits now"),
 		("ctrl+r", "redo", "redo"),
+		("t", "app.switch_mode('tables')", "pick table"),
+		("P", "app.switch_mode('profile')", "profiler"),
+		("colon", "app.switch_mode('query')", "SQL console"),
 		("q", "quit", "quit app"),
 	]
 
@@ -219,74 +706,68 @@ class TableScreen(Screen):
 		def create_connection(db_file):
 			""" create a database connection to a SQLite database """
 			if not os.path.isfile(db_file):
-				debugtee('sqlerr', 'db file missing: {}'.format(db_file))
+				print(f'db file missing: {db_file}', file=sys.stderr)
 				return False
 
 			try:
-				conn = sqlite3.connect(db_file)
-			except Error as e:
-				print(e)
+				conn = dbconn.connect(db_file, connprofile, factory=profiler.Connection)  # times statements while profiling
+			except sqlite3.Error as e:
+				print(f"Can't open {db_file}: {e}", file=sys.stderr)
 				return False
 			# Why was this important?
 			try:
-				resultset = conn.execute(f"SELECT 1 FROM {dbtable} LIMIT 1;")
-			except sqlite3.OperationalError as e:
-				print(e)
+				conn.execute(f"SELECT 1 FROM {dbtable} LIMIT 1;").fetchone()  # (fetched, so the statement doesn't stay open)
+			except sqlite3.Error as e:
+				print(f"Can't read {dbtable} from {db_file}: {e}", file=sys.stderr)
 				return False
 
-			conn.execute(
-				"PRAGMA journal_mode=WAL")  # I forget what this was for. It means can still read while db locked for writing
 			conn.row_factory = sqlite3.Row  # So row['name'] works, i.e. not just integer indices but the column name
+			conn.execute(f"PRAGMA busy_timeout={busytimeout};")  # the UI waits this long at most for another program's lock
+			conn.create_function('regexp', 2, regexp, deterministic=True)  # sqlite has the REGEXP operator, but no implementation
 			return conn
 
 		# database in current folder or above
 		dbfile = finddbfile(os.getcwd())
+		phase('finddbfile')
+		self.dbfile = dbfile  # for workers, which need their own connection
+		if dbfile:
+			self.dbstamp = sidecar.stamp(dbfile)  # before connecting, since that can create the -wal file
+			self.sidecar = sidecar.connect(dbfile)
 
 		# open connection to dbfile
 		if dbfile:
 			conn = create_connection(dbfile)
 			if not conn:
 				sys.exit(1)
+			phase('connect')
 		else:
 			print("No db file here or above.")
 			sys.exit(1)
 		return conn
 
 	def opentable(self, dbtable):
-		def get_primary_key():
-			pk = self.conn.execute("select name from pragma_table_info(?) where pk=1", (dbtable,))  # {'cid': 8, 'name': 'pk', 'type': 'INTEGER', 'notnull': 0, 'dflt_value': None, 'pk': 1}
-			pk = pk.fetchone()  # just use first primary key if more than one
-			if pk:
-				return pk['name']
-			else:
-				# no primary key, so go by rowid
-				return 'rowid'
-
-		fields = self.conn.execute("SELECT name FROM PRAGMA_TABLE_INFO(?);", (dbtable,))
-		self.headers = [field[0] for field in fields.fetchall()]
-		self.pkname = get_primary_key()
-		cur = self.conn.cursor()
+		# Schema (and profile) are cached per table, so switching tables (see switchtable) doesn't redo them. The CREATE
+		# statement is one cheap lookup, and tells if the cached schema is still good.
+		self.tblschema, kind = self.conn.execute("SELECT sql, type FROM sqlite_master WHERE name=?", (dbtable,)).fetchone()
+		cached = self.schemas.get(dbtable)
+		if cached and cached['tblschema'] == self.tblschema:
+			self.headers, self.types, self.pkname, self.pki, self.profile, self.bools = (cached[attr] for attr in ('headers', 'types', 'pkname', 'pki', 'profile', 'bools'))
+		else:
+			fields = self.conn.execute("SELECT name, type FROM PRAGMA_TABLE_INFO(?);", (dbtable,)).fetchall()
+			self.headers = [field[0] for field in fields]
+			self.types = {field[0]: field[1].upper() for field in fields}  # declared types
+			self.pkname = primarykey(self.conn, dbtable)
+			# Set pki (primary key index), i.e. column# of primary key
+			self.pki = self.headers.index(self.pkname) if self.pkname in self.headers else None
+			# Determine which columns are assumed boolean
+			self.profile = profilecolumns(self.conn, self.sidecar, dbtable, self.tblschema, self.dbstamp, self.headers, self.types, self.pkname)
+			self.bools = [field for field in self.headers if self.profile[field]['bool']]
+			self.schemas[dbtable] = {'tblschema': self.tblschema, 'headers': self.headers, 'types': self.types, 'pkname': self.pkname, 'pki': self.pki, 'profile': self.profile, 'bools': self.bools}
+		self.isview = kind == 'view'
 		# rows = cur.execute("SELECT * FROM ? WHERE name = ? LIMIT 3;", (dbtable, 'gothicmon',))  # why can't table be a ?
-		if self.pkname == 'rowid':
-			# table has no primary key, so append rowid to the end
-			self.rows = cur.execute(f"SELECT *, rowid FROM {dbtable};")
-		# self.headers.append('rowid')  # removed to try to use this as the DataTable "key"
-		else:
-			# normal case. Table has a primary key, so no need for rowid
-			self.rows = cur.execute(f"SELECT * FROM {dbtable};")
-		# Iterate fields to set pki (primary key index) and determine which columns are assumed boolean
-		self.bools = []
-		i = 0
-		for field in self.headers:
-			# Set pki to primary key index
-			if field == self.pkname:
-				# Set pki to column# of primary key
-				self.pki = i
-			i += 1
-			# Find out if column in boolean (assume it is if has only 0 and 1 values, nothing else)
-			minmax = self.conn.execute(f"SELECT min({field}) as min, max({field}) as max FROM {dbtable};").fetchone()
-			if minmax['min'] == '0' and minmax['max'] == '1':
-				self.bools.append(field)
+		# Rows get fetched a page at a time (virtualrows) or streamed in by loadrows, so don't start a full table read here.
+		# Both use the pager's SELECT, which appends rowid to the end if the table has no primary key.
+		self.pager = pager.Pager(self.conn, dbtable, self.pkname, pagesize, view=self.isview)
 
 	# Construct ROWS for the Textual table
 	# ROWS = [tuple(headers)]  # Init ROWS (first row is the header)  # doing different way now
@@ -308,29 +789,771 @@ class TableScreen(Screen):
 		#yield Static("No message yet", id="box1")
 		#yield Input(placeholder="hi!", id="updatecell")
 		yield TextAreaInput(id="updatecell")
-		yield DataTable()
+		yield MatchTable()
 		yield TextAreaSearch(id='searchbar')
+		yield TextAreaFilter(id='filterbar')
+		yield TextAreaFile(id='filebar')
 		yield Static(id='statusbar')
 
 	def on_mount(self) -> None:
+		phase('app start')  # Textual itself, and compose
 		# Open default database
 		self.conn = self.newdb(dbfname)
+		self.schemas = {}  # per table, see opentable
+		self.tablestates = OrderedDict()  # per table, see switchtable
 		# Open default table
 		self.opentable(dbtable)
+		phase('schema')
+		self.journal = None  # see undos
+		self.pending = {}  # write-behind edits not committed yet: {pk: {column#: value}}
+		self.writer = None
+		if writebehind and dbconn.writable(connprofile):
+			self.startwriter(writedelay)
+		self.conflictpk = None  # row of the last edit that found another program's change (L reloads)
+		self.editfrom = None  # (pk, column#, value) the cell editor (e) started from
+		self.stepping = False  # an undo/redo is waiting for the writer (see applystep)
+		self.ftsstate = None
+		if ftssearch:
+			self.openfts()
+		self.changeseq = None  # last change log entry seen (logchanges)
+		self.openchangelog()
+		self.loading = not virtualrows
+		self.filterpreds = []  # [(column, op)] of the filter (see pager.compilefilter)
+		self.indexcols = None  # columns of the index checkplan suggests
+		self.windowgen = 0  # bumped whenever the window's rows change (see rowsreread)
+		self.diffpks = []  # pks of the changed/added rows of the diff (D), in pk order. See showdiff.
+		self.diffcols = {}
+		self.showstats = False  # column stats in the statusbar (i)
+		self.colstats = {}  # see showcolstats
+		self.shownstats = None
+		self.pollversion = self.dataversion()
+		if pollinterval:
+			self.set_interval(pollinterval, self.pollchanges)
 		# Setup table
 		table = self.query_one(DataTable)
 		table.cursor_type = next(self.cursors)
 		table.zebra_stripes = True
 		#table.add_columns(*ROWS[0])
 		#table.add_rows(ROWS[1:])  # Start at 1 since 0 is the header
-		table.add_columns(*self.headers)
-		for row in self.rows.fetchall():
-			r = tuple(v for k,v in dict(row).items() if k != 'rowid')
-			rk = table.add_row(*r, key=row[self.pkname])
-			#print(f'{rk}, {rk.value}, {int(rk)}')
-		updatecell = self.query_one(TextAreaInput)
-		updatecell.theme = 'github_light'  # {'dracula', 'vscode_dark', 'monokai', 'github_light', 'css'}  # Only good ones: monokai, github_light
+		self.addcolumns()
+		if virtualrows:
+			self.pages = []
+			self.loadpage('first')
+			row, shift = self.fillwindow(0)
+			self.showwindow(row, 0)
+		else:
+			self.loadrows()
+		phase('first page')
 		table.focus()
+		self.call_after_refresh(phase, 'first paint')
+
+	def startwriter(self, delay):
+		self.writer = writer.Writer(self.dbfile, lambda applied, failed: self.post_message(self.Written(applied, failed)), delay, writebatch,
+			profiler.Connection, connprofile, lockretries, lockbackoff)
+
+	@property
+	def undos(self):
+		# The undo journal, opened on the first edit or undo. Most sessions only browse.
+		if self.journal is None:
+			self.journal = undostack.Journal(self.sidecar, maxundo)
+		return self.journal
+
+	# The journal is in the sidecar file, which a worker may be writing to (e.g. buildfts). The edit is in the db by
+	# then either way, so a locked sidecar only means it can't be undone, not a crash.
+	def pushundo(self, edits):
+		try:
+			return self.undos.push(dbtable, edits)
+		except sqlite3.OperationalError as e:
+			self.notify(f"Saved, but can't be undone: {e}", severity='warning')
+			return False
+
+	def markundo(self, seq, undone):
+		try:
+			self.undos.mark(dbtable, seq, undone)
+		except sqlite3.OperationalError as e:
+			self.notify(f"Undo journal not updated: {e}", severity='warning')
+
+	def connect(self, worker=None, fts=False):
+		# Connection for a worker thread (sqlite3 connections can't be shared between threads), set up like self.conn.
+		# Queries on it stop with OperationalError once worker is cancelled.
+		conn = dbconn.connect(self.dbfile, connprofile, factory=profiler.Connection)
+		conn.create_function('regexp', 2, regexp, deterministic=True)
+		if fts:
+			conn.execute("ATTACH ? AS tui;", (sidecar.path(self.dbfile),))
+		if worker:
+			conn.set_progress_handler(lambda: worker.is_cancelled, 10000)
+		return conn
+
+	# Load the whole table (virtualrows off) without freezing the UI. Rows are streamed into the DataTable in
+	# batches, so the first screen paints right away and movement/search work on what's loaded so far.
+	@work(thread=True, exclusive=True, group='loader')
+	def loadrows(self):
+		worker = get_current_worker()
+		statusbar = self.query_one('#statusbar')
+		conn = self.connect()
+		try:
+			# Cheap estimate for the progress indicator (max rowid is a single b-tree lookup, count(*) is a full scan)
+			total = conn.execute(f"SELECT max(rowid) FROM {dbtable};").fetchone()[0]
+		except sqlite3.OperationalError:
+			total = None  # WITHOUT ROWID table
+		rows = conn.execute(self.pager.sql(), self.pager.parms)
+		loaded = 0
+		app.call_from_thread(setattr, statusbar, 'display', True)
+		while not worker.is_cancelled:
+			batch = rows.fetchmany(loadbatch)
+			if not batch:
+				break
+			batch = [self.previewrow(list(r)) for r in batch]
+			# call_from_thread waits for the UI to add the batch, which keeps the worker from running ahead of it
+			app.call_from_thread(self.addrows, batch)
+			loaded += len(batch)
+			if total:
+				app.call_from_thread(statusbar.update, f'Loading {dbtable}: {loaded}/~{total} rows ({min(100, loaded * 100 // total)}%)')
+			else:
+				app.call_from_thread(statusbar.update, f'Loading {dbtable}: {loaded} rows')
+		conn.close()
+		self.loading = False
+		if not worker.is_cancelled:
+			app.call_from_thread(setattr, statusbar, 'display', False)
+
+	# Opt-in FTS5 index for search (ftssearch). Reused if it's still current, else (re)built in the background.
+	def openfts(self):
+		self.ftsstate = None  # None (not usable), 'building' or 'ready'
+		if self.isview or not dbconn.writable(connprofile):
+			return  # (its triggers and temp table count as writes)
+		if self.pkname != 'rowid' and self.types[self.pkname] != 'INTEGER':
+			self.notify('FTS search needs a rowid table or an INTEGER PRIMARY KEY')  # so the index's rowids are in pk order
+			return
+		self.ftscols = ftsindex.textcols(self.types)
+		if not self.ftscols:
+			return
+		try:
+			if 'tui' not in [db[1] for db in self.conn.execute("PRAGMA database_list;")]:  # already is if this isn't the first table
+				self.conn.execute("ATTACH ? AS tui;", (sidecar.path(self.dbfile),))
+		except sqlite3.OperationalError as e:
+			self.notify(f'No FTS index: {e}')  # e.g. sidecar can't be written
+			return
+		ftsindex.watch(self.conn, dbtable)
+		self.ftsversion = self.dataversion()
+		if ftsindex.iscurrent(self.sidecar, dbtable, self.tblschema, self.dbstamp, self.ftscols):
+			self.ftsstate = 'ready'
+		else:
+			self.buildfts()
+
+	def openchangelog(self):
+		if logchanges and not self.isview and dbconn.writable(connprofile):
+			try:
+				changelog.install(self.conn, dbtable, self.pkname)
+				self.changeseq = changelog.lastseq(self.conn)
+			except sqlite3.OperationalError as e:
+				self.notify(f'No change log: {e}')  # e.g. read-only db
+
+	def readonly(self):
+		# Edits are refused with a read-only connection profile (see dbconn.py)
+		if dbconn.writable(connprofile):
+			return False
+		self.notify(f"Read-only (connprofile is '{connprofile}')", severity='error')
+		return True
+
+	def dataversion(self):
+		# Changes when another connection commits to the db
+		return self.conn.execute("PRAGMA data_version;").fetchone()[0]
+
+	def ftsready(self):
+		# Is the FTS index usable? Applies our own edits since last time, and starts a rebuild if someone else changed the db.
+		if self.ftsstate != 'ready':
+			return False
+		version = self.dataversion()
+		if version != self.ftsversion:
+			self.ftsversion = version
+			self.buildfts()
+			return False
+		ftsindex.sync(self.conn, dbtable, self.ftscols)
+		return True
+
+	@work(thread=True, exclusive=True, group='ftsindex')
+	def buildfts(self):
+		worker = get_current_worker()
+		statusbar = self.query_one('#statusbar')
+		self.ftsstate = 'building'
+		conn = self.connect(fts=True)
+		app.call_from_thread(setattr, statusbar, 'display', True)
+
+		def progress(done):
+			app.call_from_thread(statusbar.update, f'Indexing {dbtable}: {done} rows')
+
+		try:
+			built = ftsindex.build(conn, dbtable, self.ftscols, progress=progress, cancelled=lambda: worker.is_cancelled)
+		except sqlite3.OperationalError as e:
+			built = False
+			app.call_from_thread(self.notify, f'FTS index failed: {e}')
+		conn.close()
+		if built:
+			app.call_from_thread(self.ftsbuilt)
+		app.call_from_thread(setattr, statusbar, 'display', False)
+
+	def ftsbuilt(self):
+		ftsindex.setstamp(self.sidecar, dbtable, self.tblschema, self.dbstamp, self.ftscols)
+		self.ftsstate = 'ready'
+		ftsindex.sync(self.conn, dbtable, self.ftscols)  # edits made while it was building
+		self.notify(f'FTS index for {dbtable} ready')
+
+	# Virtual rows. self.pages is a list of contiguous pages (lists of rows, in pk order) and is all of
+	# the table that's held in memory. The DataTable shows exactly what's in self.pages, so DataTable row
+	# numbers are only good until the window moves. Use the pk (the DataTable row key) to find a row again.
+	def rowpk(self, r):
+		if self.pkname == 'rowid':
+			return r[-1]  # pager appends rowid to the end
+		return r[self.pki]
+
+	def previewrow(self, r):
+		# r (a list) with preview()s of its values, except the pk's. Returns r.
+		if previewsize is not None:
+			for col, value in enumerate(r):
+				if col != self.pki and isinstance(value, (str, bytes)) and len(value) > previewsize:
+					r[col] = preview(value)
+		return r
+
+	def cellvalue(self, pk, col):
+		# Whole value of a cell, which it may only hold a preview of. Read from the db, so it's current.
+		if col in self.pending.get(pk, {}):
+			return self.pending[pk][col]  # write-behind edit the db doesn't have yet
+		row = self.conn.execute(f"SELECT {self.headers[col]} FROM {self.pager.source} WHERE {self.pkname} = ?;", (pk,)).fetchone()
+		return row[0] if row else None
+
+	def addcolumns(self):
+		# Column widths from the first widthsample rows, fixed from then on, so the DataTable doesn't measure every row
+		# it adds (or every row of a column after an edit shrank a value). Only edits widen them (see showcell).
+		table = self.query_one(DataTable)
+		if not widthsample:
+			table.colx = None
+			table.add_columns(*self.headers)
+			return
+		widths = [cellwidth(name) for name in self.headers]
+		for r in self.conn.execute(f"SELECT * FROM {self.pager.source} LIMIT ?;", (widthsample,)):
+			widths = [max(width, cellwidth(value)) for width, value in zip(widths, r)]
+		for name, width in zip(self.headers, widths):
+			table.add_column(name, width=min(width, maxcolwidth or width))
+		table.fixwidths()
+
+	def addrows(self, rows):
+		table = self.query_one(DataTable)
+		ncols = len(self.headers)
+		for r in rows:
+			table.add_row(*r[:ncols], key=self.rowpk(r))
+
+	def windowsize(self):
+		return sum(len(page) for page in self.pages)
+
+	def loadpage(self, where, pk=None):
+		# where: 'first', 'last' or 'around' (pk) replace the window, 'after' or 'before' grow it. Returns #rows added.
+		if where == 'first':
+			rows = self.pager.first()
+			self.pages = []
+			self.atstart = True
+			self.atend = len(rows) < self.pager.pagesize
+		elif where == 'last':
+			rows = self.pager.last()
+			self.pages = []
+			self.atstart = len(rows) < self.pager.pagesize
+			self.atend = True
+		elif where == 'around':
+			rows = self.pager.around(pk)
+			self.pages = []
+			self.atstart = False
+			self.atend = len(rows) < self.pager.pagesize
+		elif where == 'after':
+			rows = self.pager.after(self.rowpk(self.pages[-1][-1]))
+			self.atend = len(rows) < self.pager.pagesize
+		else:
+			rows = self.pager.before(self.rowpk(self.pages[0][0]))
+			self.atstart = len(rows) < self.pager.pagesize
+		self.windowdirty = True
+		self.windowgen += 1
+		if not rows:
+			return 0
+		page = [list(r) for r in rows]  # lists, not sqlite3.Row, so edits can be cached (see setcached)
+		if self.pending:
+			# Write-behind edits the db doesn't have yet
+			for r in page:
+				for col, value in self.pending.get(self.rowpk(r), {}).items():
+					r[col] = value
+		for r in page:
+			self.previewrow(r)
+		if where == 'before':
+			self.pages.insert(0, page)
+		else:
+			self.pages.append(page)
+		return len(page)
+
+	def fillwindow(self, row):
+		# Make sure row (a DataTable row number, maybe outside the window) has a margin of rows loaded on
+		# both sides, fetching pages toward it and evicting the ones furthest away.
+		# Returns row renumbered for the new window, and how far the old rows shifted.
+		margin = self.pager.pagesize // 2
+		shift = 0
+		while row + shift + margin >= self.windowsize() and not self.atend:
+			self.loadpage('after')
+			if len(self.pages) > maxpages:
+				shift -= len(self.pages.pop(0))
+				self.atstart = False
+		while row + shift - margin < 0 and not self.atstart:
+			shift += self.loadpage('before')
+			if len(self.pages) > maxpages:
+				self.pages.pop()
+				self.atend = False
+		return row + shift, shift
+
+	def showwindow(self, row, col, scrolly=None):
+		table = self.query_one(DataTable)
+		table.clear()
+		for page in self.pages:
+			self.addrows(page)
+		self.windowdirty = False
+		if scrolly is not None:
+			# Keep the rows that were on screen where they were, so the window moving isn't noticeable
+			table.call_after_refresh(table.scroll_to, y=scrolly, animate=False)
+		table.move_cursor(row=row, column=col)
+		self.showselection()  # row numbers changed
+
+	def movewindow(self, row, col):
+		# Virtual rows version of table.move_cursor()
+		table = self.query_one(DataTable)
+		row, shift = self.fillwindow(row)
+		row = max(0, min(row, self.windowsize() - 1))
+		if self.windowdirty:
+			self.showwindow(row, col, table.scroll_y + shift)
+		else:
+			table.move_cursor(row=row, column=col)
+
+	def gotopk(self, pk, col):
+		# Move the cursor to the row with this pk, loading it into the window first if needed
+		table = self.query_one(DataTable)
+		row = self.findrow(pk)
+		if row is not None:
+			table.move_cursor(row=row, column=col)
+		elif virtualrows:
+			# Start a new window at pk. movewindow then loads the rows before it.
+			self.loadpage('around', pk)
+			self.movewindow(0, col)
+		else:
+			self.notify('Not loaded yet')  # still streaming in (see loadrows)
+		self.painted('search')
+
+	def findrow(self, pk):
+		# DataTable row number of pk, or None if it isn't loaded
+		table = self.query_one(DataTable)
+		try:
+			return table.get_row_index(RowKey(pk))  # pk may be an int, which doesn't compare equal to the RowKey
+		except RowDoesNotExist:
+			return None
+
+	def setcached(self, pk, col, value):
+		for page in self.pages:
+			for r in page:
+				if self.rowpk(r) == pk:
+					r[col] = value
+					return
+
+	# Changes by other programs. PRAGMA data_version is a cheap read, so it's polled. When it changes, the loaded rows
+	# (or with logchanges, just the ones that changed) are re-read by pk in a worker and the differences put on screen.
+	# Note the write-behind writer counts as another program too.
+	def pollchanges(self):
+		if self.loading:
+			return  # loadrows reads with its own connection, so it'll see the change anyway
+		version = self.dataversion()
+		if version == self.pollversion:
+			return
+		self.pollversion = version
+		if self.showstats:
+			self.showcolstats()  # if it's cached, it's for the old version
+		if virtualrows:
+			if not self.pages:
+				return
+			lo = None if self.atstart else self.rowpk(self.pages[0][0])
+			hi = None if self.atend else self.rowpk(self.pages[-1][-1])
+			limit = self.windowsize() + self.pager.pagesize  # in case lots got inserted at the end
+		else:
+			lo = hi = None
+			limit = -1
+		self.rereadrows(lo, hi, limit, self.windowgen)
+
+	def rereadwindow(self):
+		# Re-read the loaded rows now instead of at the next poll, e.g. after our own import
+		self.pollversion = None
+		self.pollchanges()
+
+	@work(thread=True, exclusive=True, group='refresh')
+	def rereadrows(self, lo, hi, limit, windowgen):
+		# Re-read the rows from row lo to row hi (pks, None = no limit). With the change log, only the ones that changed.
+		conds = []
+		parms = {**self.pager.parms, 'limit': limit}
+		changed = seq = None
+		conn = self.connect(get_current_worker())
+		try:
+			conn.execute("BEGIN;")  # change log and rows from the same snapshot
+			for op, pk, prefix in (('>=', lo, 'lo'), ('<=', hi, 'hi')):
+				if pk is not None:
+					cond, keyparms = self.pager.keyset(op, pk, conn, prefix)
+					conds.append(cond)
+					parms.update(keyparms)
+			if self.changeseq is not None:
+				seq = changelog.lastseq(conn)
+				changed = changelog.changed(conn, dbtable, self.changeseq, seq)
+				conds.append(f'{self.pkname} IN (SELECT pk FROM _tui_changes WHERE tbl = :tbl AND seq > :since AND seq <= :seq)')
+				parms.update({'tbl': dbtable, 'since': self.changeseq, 'seq': seq})
+			rows = conn.execute(f"{self.pager.sql(*conds)} LIMIT :limit;", parms).fetchall()
+			conn.rollback()
+		except sqlite3.OperationalError:
+			conn.close()
+			return  # cancelled by a newer poll, which will do it instead
+		conn.close()
+		app.call_from_thread(self.rowsreread, rows, changed, limit >= 0 and len(rows) == limit, windowgen, seq)
+
+	def rowsreread(self, rows, changed, truncated, windowgen, seq):
+		table = self.query_one(DataTable)
+		if virtualrows and windowgen != self.windowgen:
+			self.pollversion = None  # window moved meanwhile, so do it over next poll
+			return
+		ncols = len(self.headers)
+		fresh = {}
+		for r in rows:
+			r = list(r)
+			for col, value in self.pending.get(self.rowpk(r), {}).items():
+				r[col] = value  # write-behind edits the db doesn't have yet
+			fresh[self.rowpk(r)] = self.previewrow(r)
+
+		if virtualrows:
+			loaded = {self.rowpk(r): r for page in self.pages for r in page}
+		elif changed is not None:
+			loaded = {pk: table.get_row(RowKey(pk)) for pk in changed if RowKey(pk) in table.rows}
+		else:
+			loaded = {key.value: table.get_row(key) for key in table.rows}
+		# Loaded rows that were re-read but didn't come back were deleted (or no longer pass the filter). Not known
+		# for the rows past where a truncated re-read stopped, but then there's a reload anyway.
+		deleted = [] if truncated else [pk for pk in loaded if (changed is None or pk in changed) and pk not in fresh]
+		inserted = [pk for pk in fresh if pk not in loaded]
+		updated = {}
+		for pk, r in fresh.items():
+			if pk in loaded:
+				cols = [col for col in range(ncols) if loaded[pk][col] != r[col]]
+				if cols:
+					updated[pk] = cols
+
+		if virtualrows and (inserted or deleted or truncated):
+			# Rows come and go, so reload the window at the cursor's row (or the next one left)
+			cur = table.cursor_coordinate
+			pks = [self.rowpk(r) for page in self.pages for r in page]
+			left = [pk for pk in pks[cur.row:] if pk not in deleted] or [pk for pk in pks[:cur.row] if pk not in deleted][-1:]
+			if left and self.loadpage('around', left[0]):
+				row, shift = self.fillwindow(0)
+				self.showwindow(row, cur.column, table.scroll_y + row - cur.row)
+			else:
+				self.loadpage('first')
+				row, shift = self.fillwindow(0)
+				self.showwindow(row, cur.column)
+		elif virtualrows:
+			for pk, cols in updated.items():
+				row = self.findrow(pk)
+				for col in cols:
+					loaded[pk][col] = fresh[pk][col]
+					table.update_cell_at((row, col), fresh[pk][col])
+		else:
+			for pk in deleted:
+				table.remove_row(RowKey(pk))
+			for pk, cols in updated.items():
+				row = self.findrow(pk)
+				for col in cols:
+					table.update_cell_at((row, col), fresh[pk][col])
+			self.addrows([fresh[pk] for pk in inserted])  # at the bottom, not in order, until the table is reloaded
+
+		if inserted or deleted or updated:
+			self.notify(f'{dbtable} changed: {len(inserted)} inserted, {len(deleted)} deleted, {len(updated)} updated')
+		if seq is not None:
+			self.changeseq = seq
+			try:
+				changelog.prune(self.conn, dbtable, seq)
+			except sqlite3.OperationalError:
+				pass  # e.g. locked. It'll go next time.
+
+	# Table picker (TablesScreen) support. Everything shares self.conn, and the schema is cached (see opentable).
+	def tablelist(self):
+		# [(name, 'table' or 'view', rows)]. Row counts are estimates from sqlite_stat1 (i.e. as of the last ANALYZE), or
+		# ~max(rowid) for tables that were never analyzed, since count(*) reads the whole table.
+		try:
+			stats = {row[0]: row[1] for row in self.conn.execute("SELECT tbl, max(CAST(stat AS INTEGER)) FROM sqlite_stat1 GROUP BY tbl;")}
+		except sqlite3.OperationalError:
+			stats = {}  # no sqlite_stat1 (never analyzed)
+		tables = []
+		for name, kind in self.conn.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite^_%' ESCAPE '^' AND name NOT LIKE '^_tui^_%' ESCAPE '^' ORDER BY name;").fetchall():
+			rows = stats.get(name, '?')
+			if name not in stats and kind == 'table':
+				try:
+					rows = f"~{self.conn.execute(f'SELECT max(rowid) FROM {name};').fetchone()[0] or 0}"
+				except sqlite3.OperationalError:
+					pass  # WITHOUT ROWID
+			tables.append((name, kind, rows))
+		return tables
+
+	def switchtable(self, name, flushed=False):
+		global dbtable
+		if name == dbtable:
+			return
+		if self.writer and not flushed:
+			self.afterflush(self.switchtable, name, True)
+			return
+		table = self.query_one(DataTable)
+		# Stop everything working on the current table
+		self.query_one(TextAreaSearch).cancel()
+		for group in ('loader', 'refresh', 'ftsindex', 'index', 'import', 'stats', 'diff'):
+			self.workers.cancel_group(self, group)
+		self.cleardiff()
+		self.pending = {}
+		self.visual = None
+		if virtualrows:
+			# Keep its window, so coming back is instant. Least recently used ones go past maxtables.
+			cur = table.cursor_coordinate
+			self.tablestates[dbtable] = {'pages': self.pages, 'atstart': self.atstart, 'atend': self.atend, 'cursor': cur, 'scrolly': table.scroll_y,
+				'pager': self.pager, 'filterpreds': self.filterpreds, 'changeseq': self.changeseq}
+			self.tablestates.move_to_end(dbtable)
+			while len(self.tablestates) > maxtables:
+				self.tablestates.popitem(last=False)
+		dbtable = name
+		self.opentable(name)
+		state = self.tablestates.pop(name, None)
+		self.filterpreds = []
+		self.changeseq = None
+		if state:
+			self.pager, self.filterpreds, self.changeseq = state['pager'], state['filterpreds'], state['changeseq']
+		self.ftsstate = None
+		if ftssearch:
+			self.openfts()
+		if self.changeseq is None:
+			self.openchangelog()
+		table.highlights = set()
+		self.query_one(TextAreaSearch).searched = ''
+		table.clear(columns=True)
+		self.addcolumns()
+		if not virtualrows:
+			self.loading = True
+			self.loadrows()
+		elif state:
+			self.pages, self.atstart, self.atend = state['pages'], state['atstart'], state['atend']
+			self.windowgen += 1
+			self.showwindow(state['cursor'].row, state['cursor'].column, state['scrolly'])
+			self.pollversion = None  # db may have changed while we were away, so the next poll re-reads the window
+		else:
+			self.loadpage('first')
+			row, shift = self.fillwindow(0)
+			self.showwindow(row, 0)
+		self.query_one('#statusbar').display = False
+		self.checkplan()
+		self.followstats()
+
+	# Sort and filter go into the pager's SELECT (so sqlite does them, using an index if there is one), then the
+	# window is reloaded at the cursor's row.
+	def sortby(self):
+		# s: by the cursor's column, then descending, then back to pk order
+		table = self.query_one(DataTable)
+		col = self.headers[table.cursor_coordinate.column]
+		if col == self.pkname:
+			col = None  # same as unsorted, so s just flips it
+		if col != self.pager.sortcol:
+			desc = False
+		elif not self.pager.desc:
+			desc = True
+		else:
+			col, desc = None, False
+		self.setview(col, desc, self.pager.filter, self.pager.parms, self.filterpreds)
+
+	def filterbar(self):
+		filterbar = self.query_one('#filterbar')
+		filterbar.display = True
+		filterbar.focus()
+		filterbar.move_cursor(filterbar.document.end)
+
+	def setfilter(self, text):
+		# Enter in the filter bar. Empty clears the filter.
+		table = self.query_one(DataTable)
+		columns = self.headers + (['rowid'] if self.pkname == 'rowid' else [])
+		try:
+			where, parms, preds = pager.compilefilter(text, columns, self.headers[table.cursor_coordinate.column]) if text else ('', {}, [])
+		except ValueError as e:
+			self.notify(f'Bad filter: {e}')
+			return
+		self.setview(self.pager.sortcol, self.pager.desc, where, parms, preds)
+
+	def setview(self, sortcol, desc, where, parms, preds):
+		table = self.query_one(DataTable)
+		view = (self.pager.sortcol, self.pager.desc, self.pager.filter, self.pager.parms)
+		self.pager.sortcol, self.pager.desc, self.pager.filter, self.pager.parms = sortcol, desc, where, parms
+		try:
+			self.pager.first()  # e.g. a bad regexp only shows up once it runs
+		except sqlite3.Error as e:
+			self.pager.sortcol, self.pager.desc, self.pager.filter, self.pager.parms = view
+			self.notify(f'Bad filter: {e}')
+			return
+		self.filterpreds = preds
+		self.workers.cancel_group(self, 'refresh')
+		self.query_one(TextAreaSearch).searched = ''  # matches are in the old order, so n/N query until the next search
+		self.visual = None
+		cur = table.cursor_coordinate
+		curpk = table.coordinate_to_cell_key(cur).row_key.value if table.row_count else None
+		if virtualrows:
+			if curpk is None or not self.loadpage('around', curpk):
+				self.loadpage('first')
+			row, shift = self.fillwindow(0)
+			self.showwindow(row, cur.column)
+		else:
+			self.workers.cancel_group(self, 'loader')
+			table.clear()
+			self.loading = True
+			self.loadrows()
+		self.checkplan()
+		self.followstats()  # stats are of the filtered rows
+
+	def checkplan(self):
+		# Say so in the statusbar when the sort/filter can't use an index, i.e. every page has to scan the table and/or
+		# sort it, and suggest one (I creates it)
+		statusbar = self.query_one('#statusbar')
+		self.indexcols = None
+		if self.pager.pkorder and not self.pager.filter:
+			return
+		# New connection, since EXPLAIN doesn't notice schema changes (like the index I just made) and a connection
+		# caches its statements, so self.conn could keep returning the old plan
+		conn = self.connect()
+		plan = self.pager.plan(conn)
+		conn.close()
+		scan = self.pager.filter and any(step.startswith('SCAN') and 'INDEX' not in step for step in plan)
+		sort = any('TEMP B-TREE' in step for step in plan)
+		if not scan and not sort:
+			return
+		cols = [col for col, op in self.filterpreds if op == '=']
+		if self.pager.sortcol:
+			cols += [self.pager.sortcol] + ([] if self.pkname == 'rowid' else [self.pkname])  # rowid is in every index anyway
+		elif not cols:
+			cols = [col for col, op in self.filterpreds if op in ('<', '<=', '>', '>=')][:1]  # LIKE, REGEXP etc. can't use one
+		cols = list(dict.fromkeys(cols))
+		problems = (['scans the table'] if scan else []) + (['sorts it'] if sort else [])
+		msg = f"Every page {' and '.join(problems)}"
+		if cols:
+			self.indexcols = cols
+			msg += f". I: create index on {dbtable}({', '.join(cols)})"
+		statusbar.update(msg)
+		statusbar.display = True
+
+	@work(thread=True, exclusive=True, group='index')
+	def createindex(self, cols):
+		statusbar = self.query_one('#statusbar')
+		name = f"tui_{dbtable}_{'_'.join(cols)}"
+		app.call_from_thread(statusbar.update, f'Creating index {name}...')
+		conn = self.connect(get_current_worker())
+		try:
+			conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {dbtable} ({', '.join(cols)});")
+			conn.commit()
+		except sqlite3.OperationalError as e:
+			app.call_from_thread(self.notify, f'Index not created: {e}')
+			return
+		finally:
+			conn.close()
+		app.call_from_thread(self.indexcreated, name)
+
+	def indexcreated(self, name):
+		self.query_one('#statusbar').display = False
+		self.notify(f'Index {name} created')
+		self.checkplan()
+
+	# Arrow keys, page up/down and the mouse move the cursor without going through movecur/jumpcur
+	def on_data_table_cell_highlighted(self, event):
+		table = self.query_one(DataTable)
+		# Skip stale events, e.g. the one from table.clear() in showwindow putting the cursor at 0,0
+		if virtualrows and event.coordinate == table.cursor_coordinate:
+			self.movewindow(event.coordinate.row, event.coordinate.column)
+		self.showselection()
+		self.followstats()
+
+	def on_data_table_row_highlighted(self, event):
+		table = self.query_one(DataTable)
+		if virtualrows and event.cursor_row == table.cursor_coordinate.row:
+			self.movewindow(event.cursor_row, table.cursor_coordinate.column)
+		self.showselection()
+
+	def on_data_table_column_highlighted(self, event):
+		self.showselection()
+		self.followstats()
+
+	# Column stats (i): aggregates for the cursor's column in the statusbar, computed by sqlite in a worker (see
+	# columnstats). Cached per table, column and filter until the db changes (PRAGMA data_version), or until we write
+	# to the column ourselves, which data_version doesn't count (see dropstats).
+	def togglestats(self):
+		self.showstats = not self.showstats
+		if self.showstats:
+			self.showcolstats()
+		else:
+			self.workers.cancel_group(self, 'stats')
+			self.query_one('#statusbar').display = False
+
+	def statskey(self):
+		col = self.headers[self.query_one(DataTable).cursor_coordinate.column]
+		return (dbtable, col, self.pager.filter, tuple(sorted(self.pager.parms.items())))
+
+	def followstats(self):
+		# Cursor moved, or the table or filter changed
+		if self.showstats and self.statskey() != self.shownstats:
+			self.showcolstats()
+
+	def showcolstats(self):
+		key = self.shownstats = self.statskey()
+		version = self.dataversion()
+		statusbar = self.query_one('#statusbar')
+		statusbar.display = True
+		cached = self.colstats.get(key)
+		if cached and cached[0] == version:
+			statusbar.update(Text(cached[1]))
+			return
+		statusbar.update(Text(f'{key[1]}: counting...'))
+		self.computestats(key, version)
+
+	@work(thread=True, exclusive=True, group='stats')
+	def computestats(self, key, version):
+		conn = self.connect(get_current_worker())
+		try:
+			stats = columnstats(conn, self.pager, key[1], stattop)
+		except sqlite3.OperationalError:
+			return  # cancelled, e.g. the cursor moved on to another column
+		finally:
+			conn.close()
+		app.call_from_thread(self.statsdone, key, version, self.statstext(key[1], stats))
+
+	def statsdone(self, key, version, text):
+		self.colstats[key] = (version, text)
+		if self.showstats and key == self.shownstats:
+			self.query_one('#statusbar').update(Text(text))
+
+	def statstext(self, col, stats):
+		def short(value):
+			text = str(preview(value))
+			return text if len(text) <= 20 else text[:19] + '…'
+
+		def number(value):
+			return f'{value:,}' if isinstance(value, int) else f'{value:,.4g}'
+
+		parts = [f"{col}: {number(stats['rows'])} rows", f"{number(stats['distinct'])} distinct", f"{number(stats['nulls'])} null"]
+		if stats['values']:
+			parts.append(f"min {short(stats['min'])}  max {short(stats['max'])}")
+		if stats['numbers']:
+			parts.append(f"sum {number(stats['sum'])}  avg {number(stats['avg'])}")
+		if stats['top']:
+			parts.append('top ' + ', '.join(f'{short(value)} ({number(count)})' for value, count in stats['top']))
+		return ' | '.join(parts)
+
+	def dropstats(self, cols=None):
+		# We wrote to column#s cols (None = any of them), so their cached stats are out of date
+		names = None if cols is None else {self.headers[col] for col in cols}
+		for key in [key for key in self.colstats if key[0] == dbtable and (names is None or key[1] in names)]:
+			del self.colstats[key]
+		if self.showstats and (names is None or self.shownstats[1] in names):
+			self.showcolstats()
 
 	def searchbar(self):
 		searchbar = self.query_one('#searchbar')
@@ -339,37 +1562,424 @@ class TableScreen(Screen):
 		searchbar.clear()
 
 	def yank(self):
+		# Copy what the cursor covers (cell, row or column, see key_c), or the visual mode selection, as lines of tab
+		# separated fields (what p in visual mode pastes). Read from the db, so rows that aren't loaded count too.
 		table = self.query_one(DataTable)
-		cur_row = table.cursor_coordinate.row
-		cur_col = table.cursor_coordinate.column
-		pyperclip.copy(table.get_cell_at((cur_row, cur_col,)))
+		if table.row_count == 0:
+			return
+		if self.visual:
+			lo, hi, c0, c1 = self.selection()
+		else:
+			pk = table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value
+			col = table.cursor_coordinate.column
+			if table.cursor_type == 'row':
+				lo, hi, c0, c1 = pk, pk, 0, len(self.headers) - 1
+			elif table.cursor_type == 'column':
+				lo, hi, c0, c1 = None, None, col, col
+			else:
+				lo, hi, c0, c1 = pk, pk, col, col
+		self.yankrange(lo, hi, self.headers[c0:c1 + 1])
+
+	@work(thread=True, exclusive=True, group='yank')
+	def yankrange(self, lo, hi, cols):
+		worker = get_current_worker()
+		conn = self.connect(worker)
+		try:
+			where, parms = self.rangewhere(lo, hi, conn)
+			rows = conn.execute(f"SELECT {', '.join(cols)} FROM {self.pager.source} {where} ORDER BY {self.pager.orderby()};", parms).fetchall()
+		except sqlite3.OperationalError:
+			return  # cancelled
+		finally:
+			conn.close()
+		if len(rows) == 1 and len(cols) == 1:
+			text = '' if rows[0][0] is None else str(rows[0][0])
+		else:
+			text = '\n'.join('\t'.join('' if value is None else str(value) for value in row) for row in rows)
+		pyperclip = clipboard()
+		try:
+			pyperclip.copy(text)
+		except pyperclip.PyperclipException as e:
+			app.call_from_thread(self.notify, f'Yank failed: {e}', severity='error')
+			return
+		if len(rows) > 1 or len(cols) > 1:
+			app.call_from_thread(self.notify, f'Yanked {len(rows)} rows of {len(cols)} columns')
+
+	def filebar(self, onenter, text=None):
+		filebar = self.query_one('#filebar')
+		filebar.onenter = onenter
+		if text:
+			filebar.load_text(text)
+		elif not filebar.text:
+			filebar.load_text(f'{dbtable}.csv')
+		filebar.display = True
+		filebar.focus()
+		filebar.move_cursor(filebar.document.end)
+
+	# Diff (D) against the same table in another db, e.g. a backup: rows that are new here and cells that are different
+	# get highlighted, and n/N go from one to the next (in pk order) until escape. Rows only the other db has can't be
+	# shown, so the statusbar counts them. Done in a worker with the other db ATTACHed (see dbdiff.py).
+	def startdiff(self, path):
+		path = os.path.abspath(os.path.expanduser(path))
+		if self.isview:
+			self.notify("Can't diff a view (no primary key)", severity='error')
+		elif not os.path.isfile(path):
+			self.notify(f'No db file {path}', severity='error')
+		elif path == os.path.abspath(self.dbfile):
+			self.notify("That's this db. Diff with which copy of it?", severity='error')
+		else:
+			self.diffrows(path)
+
+	@work(thread=True, exclusive=True, group='diff')
+	def diffrows(self, path):
+		worker = get_current_worker()
+		statusbar = self.query_one('#statusbar')
+		app.call_from_thread(setattr, statusbar, 'display', True)
+		app.call_from_thread(statusbar.update, f'Diffing {dbtable} with {path}...')
+		conn = self.connect(worker)
+		diffs = {}  # pk: changed column#s, or None for an added row
+		counts = {'changed': 0, 'added': 0, 'removed': 0}
+		removed = []  # the first few, for the statusbar
+		try:
+			dbdiff.attach(conn, path)
+			othercols = dbdiff.columns(conn, dbtable)
+			if othercols is None:
+				app.call_from_thread(self.notify, f'{path} has no table {dbtable}', severity='error')
+				return
+			cols = [col for col in self.headers if col in othercols and col != self.pkname]
+			intpk = self.pkname == 'rowid' or self.types[self.pkname] == 'INTEGER'
+			for kind, pk, changed in dbdiff.diff(conn, dbtable, self.pkname, cols, chunksize=diffchunk, intpk=intpk,
+					progress=lambda done, total: app.call_from_thread(statusbar.update, f'Diffing {dbtable} with {path}: {done * 100 // total}%'),
+					cancelled=lambda: worker.is_cancelled):
+				counts[kind] += 1
+				if kind == 'removed':
+					if len(removed) < 5:
+						removed.append(pk)
+				elif len(diffs) < maxdiffs:
+					diffs[pk] = None if kind == 'added' else [self.headers.index(col) for col in changed]
+		except sqlite3.Error as e:
+			if not worker.is_cancelled:
+				app.call_from_thread(self.notify, f'Diff failed: {e}', severity='error')
+			return
+		finally:
+			conn.close()
+		if worker.is_cancelled:
+			app.call_from_thread(statusbar.update, 'Diff cancelled')
+			return
+		missing = [col for col in self.headers if col not in othercols]
+		app.call_from_thread(self.showdiff, path, diffs, counts, removed, missing)
+
+	def showdiff(self, path, diffs, counts, removed, missing):
+		table = self.query_one(DataTable)
+		table.diffs = {}
+		for pk, cols in diffs.items():
+			if cols is None:
+				table.diffs[(pk, None)] = addedstyle
+			else:
+				for col in cols:
+					table.diffs[(pk, col)] = changedstyle
+		self.diffpks = sorted(diffs)
+		self.diffcols = diffs
+		table.refresh()
+		msg = f"Diff with {path}: {counts['changed']} changed, {counts['added']} added, {counts['removed']} removed rows"
+		if removed:
+			msg += f" (removed: {', '.join(str(pk) for pk in removed)}{', ...' if counts['removed'] > len(removed) else ''})"
+		if len(diffs) < counts['changed'] + counts['added']:
+			msg += f'. First {maxdiffs} highlighted'
+		if missing:
+			msg += f". Not compared (not in {os.path.basename(path)}): {', '.join(missing)}"
+		if self.diffpks:
+			msg += '. n/N: next/previous, escape: done'
+		statusbar = self.query_one('#statusbar')
+		statusbar.update(Text(msg))
+		statusbar.display = True
+
+	def nextdiff(self, reverse=False):
+		table = self.query_one(DataTable)
+		pk = table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value
+		i = bisect_left(self.diffpks, pk) - 1 if reverse else bisect_right(self.diffpks, pk)
+		if not 0 <= i < len(self.diffpks):
+			if not searchwrap:
+				self.notify('No more differences')
+				return
+			i %= len(self.diffpks)
+		pk = self.diffpks[i]
+		cols = self.diffcols[pk]
+		self.gotopk(pk, cols[0] if cols else table.cursor_coordinate.column)
+		self.query_one('#statusbar').update(f'Difference {i + 1}/{len(self.diffpks)}')
+
+	def cleardiff(self):
+		table = self.query_one(DataTable)
+		if table.diffs:
+			table.diffs = {}
+			table.refresh()
+		self.diffpks = []
+		self.diffcols = {}
+
+	# Write the whole table, filtered and sorted as shown, to a file. Streamed from sqlite in the background (see
+	# export.py), into path.part first, so a cancelled (escape) or failed export doesn't leave half a file behind.
+	@work(thread=True, exclusive=True, group='export')
+	def exportrows(self, path):
+		worker = get_current_worker()
+		statusbar = self.query_one('#statusbar')
+		path = os.path.expanduser(path)
+		fmt = export.formatof(path)
+		if fmt is None:
+			app.call_from_thread(self.notify, f"Export to what? Known extensions: {' '.join(export.formats)}", severity='error')
+			return
+		app.call_from_thread(setattr, statusbar, 'display', True)
+		conn = self.connect(worker)
+		done = None
+		try:
+			cur = conn.execute(self.pager.sql(columns=self.headers), self.pager.parms)
+			with open(f'{path}.part', 'w', newline='') as f:
+				done = export.write(f, fmt, cur, progress=lambda n: app.call_from_thread(statusbar.update, f'Exporting to {path}: {n} rows'), cancelled=lambda: worker.is_cancelled)
+			if done is not None:
+				os.replace(f'{path}.part', path)
+		except sqlite3.OperationalError:
+			pass  # cancelled
+		except (OSError, sqlite3.Error) as e:
+			app.call_from_thread(self.notify, f'Export failed: {e}', severity='error')
+		finally:
+			conn.close()
+		if done is None:
+			if os.path.exists(f'{path}.part'):
+				os.remove(f'{path}.part')
+			app.call_from_thread(statusbar.update, f'Export to {path} stopped')
+			return
+		app.call_from_thread(statusbar.update, f'Exported {done} rows to {path}')
 
-	# Not used yet. For now, hit 'e' for edit and ctrl-shift-v to paste
 	def put(self):
-		spam = pyperclip.paste()
+		# p outside visual mode: the clipboard's lines become rows, tab separated fields their columns starting at the
+		# cursor's (see importrows)
+		text = self.paste()
+		if text is not None:
+			self.startimport(None, text, self.query_one(DataTable).cursor_coordinate.column)
+
+	def paste(self):
+		# The clipboard's text, or None if there's no clipboard to get it from (e.g. over ssh, see yankrange)
+		pyperclip = clipboard()
+		try:
+			return pyperclip.paste()
+		except pyperclip.PyperclipException as e:
+			self.notify(f'Paste failed: {e}', severity='error')
+			return None
+
+	def startimport(self, path, text=None, firstcol=0):
+		if self.readonly():
+			return
+		if self.isview:
+			self.notify("Can't import into a view", severity='error')
+			return
+		self.importrows(path, text, firstcol)
+
+	# Import a CSV/TSV file (or pasted text) in the background, a transaction per importbatch rows. Columns are
+	# mapped by the first line if it's column names, else by position from firstcol on. Rows whose pk is already there get updated
+	# (upsert), the rest inserted. The whole import is one undo step, and afterwards only the loaded rows get re-read.
+	@work(thread=True, exclusive=True, group='import')
+	def importrows(self, path, text=None, firstcol=0):
+		worker = get_current_worker()
+		if self.writer:
+			self.writer.flush()  # so queued edits can't land on top of this (waits here, in the worker)
+		statusbar = self.query_one('#statusbar')
+		if path:
+			path = os.path.expanduser(path)
+			fmt = export.formatof(path)
+			if fmt not in ('csv', 'tsv'):
+				app.call_from_thread(self.notify, 'Import from what? Known extensions: ' + ' '.join(ext for ext, fmt in export.formats.items() if fmt != 'jsonl'), severity='error')
+				return
+			try:
+				f = open(path, newline='')
+				total = os.path.getsize(path)
+			except OSError as e:
+				app.call_from_thread(self.notify, f'Import failed: {e}', severity='error')
+				return
+		else:
+			fmt = 'tsv'
+			f = io.StringIO(text)
+			total = len(text)
+		null = '\\N' if fmt == 'tsv' else ''  # see export.py
+		read = 0
+
+		def lines():
+			nonlocal read
+			for line in f:
+				read += len(line)
+				yield line
+
+		reader = csv.reader(lines(), delimiter='\t' if fmt == 'tsv' else ',')
+		first = next(reader, None)
+		if not first:
+			return
+		if all(name in self.headers for name in first):
+			cols, first = first, []
+		elif any(name in self.headers and name != '' for name in first):
+			# Looks like column names, with some that aren't. Imported as data, it'd put names into every column.
+			unknown = ', '.join(name or "''" for name in first if name not in self.headers)
+			app.call_from_thread(self.notify, f'Import failed: the first line has column names, but {dbtable} has no {unknown}', severity='error')
+			return
+		elif firstcol + len(first) <= len(self.headers):
+			cols, first = self.headers[firstcol:firstcol + len(first)], [first]
+		else:
+			app.call_from_thread(self.notify, f'Import failed: {len(first)} fields, but {dbtable} only has {len(self.headers) - firstcol} columns from {self.headers[firstcol]} on', severity='error')
+			return
+		pk = self.pkname
+		names = ', '.join(cols)
+		sql = f"INSERT INTO {dbtable} ({names}) VALUES ({', '.join('?' * len(cols))})"
+		if pk in cols:
+			updates = [f'{col}=excluded.{col}' for col in cols if col != pk]
+			sql += f" ON CONFLICT({pk}) DO {'UPDATE SET ' + ', '.join(updates) if updates else 'NOTHING'}"
+		lookup = f"SELECT {pk}, {names} FROM {dbtable} WHERE {pk} = ?"
+		colnums = [self.headers.index(col) for col in cols]
+		app.call_from_thread(setattr, statusbar, 'display', True)
+		conn = self.connect(worker)
+		side = sidecar.connect(self.dbfile)  # the journal's own connection, sqlite3 connections can't change threads
+		journal = undostack.Journal(side, maxundo)
+		done = 0
+		error = None
+		undoable = True
+		try:
+			with journal.group():
+				while not worker.is_cancelled:
+					chunk = first + [line for line in islice(reader, importbatch - len(first)) if line]
+					first = []
+					if not chunk:
+						break
+					rows = []
+					for line in chunk:
+						if len(line) > len(cols):
+							raise ValueError(f'{len(line)} fields in {line}, but only {len(cols)} columns')
+						rows.append([None if value == null else value for value in line] + [None] * (len(cols) - len(line)))
+					conn.execute("BEGIN IMMEDIATE;")
+					# Rows as they were and are, for the undo journal. Read back from the db, since values got converted
+					# going by the column types, and new rows got their pk (or rowid) from sqlite.
+					if pk in cols:
+						key = cols.index(pk)
+						keyed = [row for row in rows if row[key] is not None]
+						old = [conn.execute(lookup, (row[key],)).fetchone() for row in keyed]
+						conn.executemany(sql, keyed)
+						new = [conn.execute(lookup, (row[key],)).fetchone() for row in keyed]
+						# No pk (empty field), so sqlite picks one. One at a time, to read each back by its rowid.
+						for row in rows:
+							if row[key] is None:
+								rowid = conn.execute(sql, row).lastrowid
+								old.append(None)
+								new.append(conn.execute(f"SELECT {pk}, {names} FROM {dbtable} WHERE rowid = ?", (rowid,)).fetchone())
+					else:
+						last = conn.execute(f"SELECT coalesce(max(rowid), 0) FROM {dbtable};").fetchone()[0]
+						conn.executemany(sql, rows)
+						new = conn.execute(f"SELECT {pk}, {names} FROM {dbtable} WHERE rowid > ? ORDER BY rowid;", (last,)).fetchall()
+						old = [None] * len(new)
+					edits = []
+					seen = set()
+					for was, now in zip(old, new):
+						if now[0] in seen:
+							continue  # same pk twice in the chunk
+						seen.add(now[0])
+						if was is None:
+							edits.append({'pk': now[0], 'col': None, 'changefrom': None, 'changeto': json.dumps({pk: now[0], **dict(zip(cols, now[1:]))})})
+						else:
+							edits += [{'pk': now[0], 'col': col, 'changefrom': was[1 + i], 'changeto': now[1 + i]} for i, col in enumerate(colnums) if was[1 + i] != now[1 + i]]
+					if undoable and not journal.keeps(len(edits)):
+						undoable = False
+						app.call_from_thread(self.notify, f"Import too big to undo (over {maxundo} cells, see maxundo). Rows so far stay imported, escape stops it.", severity='warning', timeout=30)
+					conn.commit()
+					journal.push(dbtable, edits)
+					done += len(rows)
+					filled = min(20, 20 * read // max(total, 1))
+					app.call_from_thread(statusbar.update, f"Importing {'█' * filled}{'░' * (20 - filled)} {done} rows")
+		except (ValueError, TypeError, sqlite3.Error) as e:
+			conn.rollback()
+			error = e
+		finally:
+			conn.close()
+			side.close()
+			f.close()
+		if worker.is_cancelled:  # (a cancel mid-chunk interrupts its queries, see connect)
+			app.call_from_thread(statusbar.update, f'Import cancelled after {done} rows')
+		elif error:
+			app.call_from_thread(self.notify, f'Import stopped after {done} rows: {error}', severity='error')
+		else:
+			app.call_from_thread(statusbar.update, f'Imported {done} rows')
+		if done:
+			app.call_from_thread(self.rereadwindow)
 
 	def action_undo(self):
-		query = self.undos.undo()
-		print(f'{query}')
-		if query:
+		if self.readonly():
+			return
+		if self.stepping:
+			return  # (see applystep)
+		edits = self.undos.undo(dbtable)
+		profiler.note(edits)
+		if edits and (len(edits) > 1 or edits[0]['col'] is None):
+			app.clear_notifications()
+			self.applystep(dbtable, edits, 'changefrom', 1)
+		elif edits:
 			app.clear_notifications()
-			self.changecell(query['sql'], query['pk'], query['changefrom'], query['changeto'], query['row'], query['col'], isnew=False)  # swapped changefrom and changeto
+			edit = edits[0]
+			self.changecell(f'update {dbtable} set {self.headers[edit["col"]]}=? where {self.pkname}=?', edit['pk'], edit['changefrom'], edit['changeto'], None, edit['col'], isnew=False, step=(edit['seq'], 1))  # swapped changefrom and changeto
 		else:
 			self.notify('Already at oldest change')
 
 	def action_redo(self):
-		query = self.undos.redo()
-		print(f'{query}')
-		if query:
+		if self.readonly():
+			return
+		if self.stepping:
+			return
+		edits = self.undos.redo(dbtable)
+		profiler.note(edits)
+		if edits and (len(edits) > 1 or edits[0]['col'] is None):
+			app.clear_notifications()
+			self.applystep(dbtable, edits, 'changeto', 0)
+		elif edits:
 			app.clear_notifications()
-			self.changecell(query['sql'], query['pk'], query['changeto'], query['changefrom'], query['row'], query['col'], isnew=False)
+			edit = edits[0]
+			self.changecell(f'update {dbtable} set {self.headers[edit["col"]]}=? where {self.pkname}=?', edit['pk'], edit['changeto'], edit['changefrom'], None, edit['col'], isnew=False, step=(edit['seq'], 0))
 		else:
 			self.notify('Already at newest change')
 
+	def applystep(self, tbl, edits, field, undone, flushed=False):
+		# Undo/redo of a step with many cells (or whole rows), written here in one go. Write-behind edits still queued
+		# go first, or this would overtake them. Meanwhile u/ctrl+r wait, as the step isn't marked undone/redone yet.
+		if self.writer and not flushed:
+			self.stepping = True
+			self.afterflush(self.applystep, tbl, edits, field, undone, True)
+			return
+		self.stepping = False
+		if tbl != dbtable:
+			return  # switched tables meanwhile
+		if self.applyedits(edits, field) is not None:
+			self.markundo(edits[0]['seq'], undone)
+
 	def action_quit(self):
+		self.query_one(TextAreaSearch).cancel()
+		self.workers.cancel_group(self, 'loader')
+		self.workers.cancel_group(self, 'ftsindex')
+		self.workers.cancel_group(self, 'refresh')
+		self.workers.cancel_group(self, 'index')
+		self.workers.cancel_group(self, 'export')
+		self.workers.cancel_group(self, 'import')
+		self.workers.cancel_group(self, 'stats')
+		self.workers.cancel_group(self, 'diff')
+		self.closewriter()
+		keepfts = self.ftsready()  # applies any edits still pending for the index
 		self.conn.close()
+		if keepfts:
+			# Index matches the db as we leave it, so it can be reused next time (stamp after close, which may checkpoint)
+			ftsindex.setstamp(self.sidecar, dbtable, self.tblschema, sidecar.stamp(self.dbfile), self.ftscols)
+		self.sidecar.close()
 		sys.exit()
 
+	def closewriter(self):
+		# Commit whatever write-behind edits are still queued, and stop the writer thread
+		if self.writer:
+			for edit in self.writer.close():
+				logerror(edit['error'], edit['sql'], edit['parms'])
+			self.writer = None
+
+	def on_unmount(self):
+		# Any other way out than q (e.g. ctrl+q) would kill the writer thread (a daemon) with edits still queued
+		self.closewriter()
+
 	# Aborted attempt at hiding a column by setting width to 0. Doesn't work.
 	def hide_column(self, col_label):
 		table = self.query_one(DataTable)
@@ -387,29 +1997,59 @@ class TableScreen(Screen):
 		#else:
 		#	print(f'label is not "id": {v.label}, t: {type(v.label)}')
 
-	# Update both table cell and db
-	def changecell(self, sql, pk, changeto, changefrom, row, col, isnew=True, update_width=False):
-		table = self.query_one(DataTable)
-		parms = (changeto, pk)
-		try:
-			cur = self.conn.execute(sql, parms)
-		except sqlite3.OperationalError as e:
-			with open('/tmp/sqlite-tui2-errors.log', 'a') as f:
-				f.write(f'{e}\n')
-				f.write(f'{sql}, {parms}')
+	# Update both table cell and db. step: (seq, undone) of the undo/redo this is, for marking it done once it's written.
+	def changecell(self, sql, pk, changeto, changefrom, row, col, isnew=True, update_width=False, step=None):
+		if self.readonly():
+			return False
+		# Only if the cell still holds changefrom. Otherwise another program changed it since, and this would overwrite
+		# that without anyone knowing (see conflict).
+		sql += f' AND {self.headers[col]} IS ?'
+		parms = (changeto, pk, changefrom)
+		if not self.writer:
+			try:
+				cur = self.conn.execute(sql, parms)
+			except sqlite3.OperationalError as e:
+				if not dbconn.busy(e):
+					logerror(e, sql, parms)
+					return False
+				if self.conn.in_transaction:
+					self.conn.rollback()
+				# Another program has held the write lock for busytimeout already. Rather than keep the UI waiting, edits go
+				# through a writer thread from now on, which waits for the lock and retries with backoff (see writer.py).
+				profiler.count('edits handed to a writer (db locked)')
+				self.startwriter(0)
+				self.notify('The db is locked by another program. Edits get saved as soon as it lets go.', severity='warning')
+			else:
+				if cur.rowcount == 1:
+					# success
+					self.conn.commit()
+					# sql update successful, so update table on screen too
+					row = self.showcell(pk, row, col, changeto, update_width)
+					if isnew:
+						# Only push onto undos stack if new. undo/redo use changecell too and need to pass isnew=False
+						self.pushundo([{'pk': pk, 'col': col, 'changeto': changeto, 'changefrom': changefrom}])
+					if step:
+						self.markundo(*step)
+					return True
+				return self.changefailed(cur, pk, col)
+		# Write-behind: show it now, and the writer thread commits it with the rest of its batch. The journal counts it as
+		# written right away (so u/ctrl+r go on to the next step), and on_table_screen_written takes that back if it fails.
+		edit = {'sql': sql, 'parms': parms, 'tbl': dbtable, 'pk': pk, 'col': col, 'changeto': changeto, 'changefrom': changefrom, 'seq': None, 'step': step}
+		if isnew and self.pushundo([{'pk': pk, 'col': col, 'changeto': changeto, 'changefrom': changefrom}]):
+			edit['seq'] = self.undos.lastseq
+		if step:
+			self.markundo(*step)
+		self.writer.put(edit)
+		self.pending.setdefault(pk, {})[col] = changeto
+		row = self.showcell(pk, row, col, changeto, update_width)
+		return True
+
+	def changefailed(self, cur, pk, col):
+		if cur.rowcount == 0:
+			# Row deleted, or the cell changed, since it was loaded
+			self.conn.rollback()
+			self.conflict(pk, col)
 			return False
-		if cur.rowcount == 1:
-			# success
-			self.conn.commit()
-			# sql update successful, so update table on screen too
-			table.update_cell_at((row, col), changeto, update_width=update_width)
-			if isnew:
-				# Only push onto undos stack if new. undo/redo use changecell too and need to pass isnew=False
-				self.undos.push({'sql': sql, 'pk': pk, 'changeto': changeto, 'changefrom': changefrom, 'row': row, 'col': col})
-			return True
-		elif cur.rowcount == 0:
-			# failure
-			self.notify("DB change unsuccessful")
 		elif cur.rowcount < 0:
 			# huh?
 			self.notify("rowcount < 0???")
@@ -417,13 +2057,102 @@ class TableScreen(Screen):
 			# rowcount > 1 (not good!)
 			self.notify('Updated more than 1 row???')
 		# Only error cases get here, so rollback
-		print(f'crc: {cur.rowcount}')
+		profiler.note(f'changecell rowcount {cur.rowcount}')
 		self.conn.rollback()
 		return False
 
+	def conflict(self, pk, col):
+		# An edit found the cell changed by another program (or the row gone), so it wasn't saved. Show what the db has
+		# now, and offer to reload the rest of the loaded rows (the next poll would, but that may be a while).
+		profiler.count('edit conflicts')
+		row = self.conn.execute(f"SELECT {self.headers[col]} FROM {self.pager.source} WHERE {self.pkname} = ?;", (pk,)).fetchone()
+		if row is None:
+			msg = f'Row {pk} was deleted by another program'
+		else:
+			self.showcell(pk, None, col, row[0])
+			msg = f'{self.headers[col]} of row {pk} was changed by another program (to what it shows now)'
+		self.conflictpk = pk
+		self.notify(f'{msg}, so nothing was written. L reloads the rows.', severity='warning')
+
+	def reloadrows(self):
+		self.conflictpk = None
+		self.rereadwindow()
+		self.notify('Reloaded')
+
+	def showcell(self, pk, row, col, value, update_width=False):
+		# Put value in the cell on screen. Returns its row#, which may be None if it isn't loaded.
+		# Pass row=None if it isn't known (e.g. undo).
+		table = self.query_one(DataTable)
+		value = preview(value)
+		if virtualrows:
+			self.setcached(pk, col, value)
+		if virtualrows or row is None:
+			# row is stale if the window moved since (e.g. undo), and the row may not even be loaded anymore
+			row = self.findrow(pk)
+		if row is not None:
+			table.update_cell_at((row, col), value, update_width=update_width and table.colx is None)
+			if update_width:
+				table.widen(col, value)
+		self.dropstats([col])
+		self.painted('edit')
+		return row
+
+	def painted(self, what):
+		# Profiling: time from the key press being handled to the screen showing the result of it
+		if profiler.enabled:
+			self.call_after_refresh(profiler.latency, what, app.keytime)
+
+	class Written(Message):
+		"""Posted by the write-behind writer thread after each batch it commits."""
+		def __init__(self, applied, failed):
+			self.applied = applied
+			self.failed = failed
+			super().__init__()
+
+	def on_table_screen_written(self, message):
+		for edit in message.applied + message.failed:
+			if edit['tbl'] != dbtable:
+				continue  # switched tables since (see switchtable)
+			# Done with it, unless the cell got edited again in the meantime
+			cols = self.pending.get(edit['pk'], {})
+			if cols.get(edit['col']) == edit['changeto']:
+				del cols[edit['col']]
+				if not cols:
+					del self.pending[edit['pk']]
+		for edit in message.failed:
+			# Not written after all, so it's not undoable (new edit), or not undone/redone
+			if edit['seq']:
+				self.undos.forget(edit['tbl'], edit['seq'])
+			elif edit['step']:
+				self.undos.mark(edit['tbl'], edit['step'][0], 1 - edit['step'][1])
+			if edit['tbl'] == dbtable and edit.get('conflict'):
+				self.conflict(edit['pk'], edit['col'])
+				continue
+			if edit['tbl'] == dbtable:
+				# Put the cell back the way it was
+				self.showcell(edit['pk'], None, edit['col'], edit['changefrom'])
+			self.notify(f"Edit of {edit['tbl']} row {edit['pk']} failed: {edit['error']}", severity='error')
+			logerror(edit['error'], edit['sql'], edit['parms'])
+		if self.ftsstate == 'ready' and message.applied:
+			# Written through another connection, so the temp triggers didn't see it and data_version changed
+			ftsindex.markdirty(self.conn, dbtable, [edit['pk'] for edit in message.applied if edit['tbl'] == dbtable])
+			self.ftsversion = self.dataversion()
+
+	def action_save(self):
+		if self.writer:
+			self.writer.flush(lambda failed: failed or app.call_from_thread(self.notify, 'Saved'))
+
+	def afterflush(self, then, *args):
+		# then(*args) once the writer has committed everything queued, so it can't land on top of what then does. The
+		# writer may be waiting out another program's lock (see writer.py), so the UI doesn't wait, it gets called back.
+		self.writer.flush(lambda failed: app.call_from_thread(then, *args))
+
 	# Toggles current cell if it's "boolean"
 	# Use with care, i.e. only on columns that really are boolean
 	def action_togglecurcell(self):
+		if self.visual:
+			self.changerange('toggle')
+			return
 		table = self.query_one(DataTable)
 		cur_row = table.cursor_coordinate.row
 		cur_col = table.cursor_coordinate.column
@@ -433,11 +2162,9 @@ class TableScreen(Screen):
 			return
 		# Else, assume column is boolean
 		text = table.get_cell_at((cur_row, cur_col,))
-		if text == '0':
-			changeto = '1'
-		elif text == '1':
-			changeto = '0'
-		else:
+		# Keep the type the db had it as (integer or string)
+		changeto = {0: 1, 1: 0, '0': '1', '1': '0'}.get(text)
+		if changeto is None:
 			return  # do nothing, not even let user know this failed
 		# Get the row's primary key value
 		if self.pki:
@@ -447,15 +2174,173 @@ class TableScreen(Screen):
 		#print(f'wehre pk={pk}, setting {col} to {changeto}')
 		self.changecell(f'update {dbtable} set {col}=? where {self.pkname}=?', pk, changeto, text, cur_row, cur_col)
 
+	# Visual mode: v starts selecting a range from the cursor, v or escape stops. Like the cursor itself, it selects
+	# cells, whole rows or whole columns depending on the cursor type (c). Then space toggles, e sets, x clears and
+	# p pastes (lines to rows, tabs to columns) over the whole range, in one transaction and one undo step.
+	def togglevisual(self):
+		table = self.query_one(DataTable)
+		if self.visual or table.row_count == 0:
+			self.visual = None
+		else:
+			self.visual = (table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value, table.cursor_coordinate.column)
+		self.showselection()
+
+	def selection(self):
+		# (first pk, last pk, first column#, last column#) of the visual mode selection. pks are None for whole columns.
+		table = self.query_one(DataTable)
+		pk0, col0 = self.visual
+		pk1 = table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value
+		col1 = table.cursor_coordinate.column
+		row0 = self.findrow(pk0)
+		if row0 is not None:
+			lo, hi = (pk0, pk1) if row0 <= table.cursor_coordinate.row else (pk1, pk0)
+		else:
+			# Start of the selection isn't in the window anymore, so ask sqlite which way it is (see pager)
+			lo, hi = (pk0, pk1) if self.pager.precedes(pk0, pk1) else (pk1, pk0)
+		c0, c1 = min(col0, col1), max(col0, col1)
+		if table.cursor_type == 'row':
+			c0, c1 = 0, len(self.headers) - 1
+		elif table.cursor_type == 'column':
+			lo = hi = None
+		return lo, hi, c0, c1
+
+	def showselection(self):
+		# Selection as row numbers for MatchTable, i.e. only good until the window moves. Rows outside the window are
+		# -1 (before) or row_count (after).
+		table = self.query_one(DataTable)
+		selection = None
+		if self.visual and table.row_count:
+			lo, hi, c0, c1 = self.selection()
+			if lo is None:
+				selection = (None, None, c0, c1)
+			else:
+				r0, r1 = self.findrow(lo), self.findrow(hi)
+				selection = (-1 if r0 is None else r0, table.row_count if r1 is None else r1, c0, c1)
+		if selection != table.selection:
+			table.selection = selection
+			table.refresh()
+
+	def rangewhere(self, lo, hi, conn=None):
+		# WHERE clause (and parameters) for the rows from lo to hi (pks, None for all) in the current sort order, of
+		# the ones that pass the filter (see pager). conn is for calling from a worker.
+		parms = dict(self.pager.parms)
+		conds = []
+		if lo is not None:
+			for op, key, prefix in (('>=', lo, 'lo'), ('<=', hi, 'hi')):
+				cond, keyparms = self.pager.keyset(op, key, conn, prefix)
+				conds.append(cond)
+				parms.update(keyparms)
+		return self.pager.where(*conds), parms
+
+	def changerange(self, op, value=None, selection=None):
+		# op: 'set' (to value), 'clear' (to NULL), 'toggle' (booleans), or 'paste' (value is the clipboard)
+		if self.readonly():
+			return
+		if self.writer and selection is None:
+			# The selection as it is now, not after the cursor may have moved meanwhile
+			self.afterflush(self.changerange, op, value, self.selection())
+			return
+		lo, hi, c0, c1 = selection or self.selection()
+		cols = [col for col in range(c0, c1 + 1) if self.headers[col] != self.pkname]
+		if op == 'toggle':
+			cols = [col for col in cols if self.headers[col] in self.bools]
+		if not cols:
+			return
+		pk = self.pkname
+		where, parms = self.rangewhere(lo, hi)
+		names = [self.headers[col] for col in cols]
+		# Old values, for undo
+		rows = self.conn.execute(f"SELECT {pk}, {', '.join(names)} FROM {dbtable} {where} ORDER BY {self.pager.orderby()};", parms).fetchall()
+		if not self.undos.keeps(len(rows) * len(cols)):
+			self.notify(f'{len(rows) * len(cols)} cells is too many to undo (see maxundo), so this one is for good', severity='warning')
+		if op == 'paste':
+			# Line i goes to row i of the range and tab separated fields to its columns, as far as both go
+			lines = value.rstrip('\n').split('\n')
+			edits = []
+			for row, line in zip(rows, lines):
+				for i, field in enumerate(line.rstrip('\r').split('\t')[:len(cols)]):
+					edits.append({'pk': row[0], 'col': cols[i], 'changeto': field, 'changefrom': row[1 + i]})
+		else:
+			flip = {0: 1, 1: 0, '0': '1', '1': '0'}
+			value = None if op == 'clear' else value
+			edits = []
+			for row in rows:
+				for i, col in enumerate(cols):
+					old = row[1 + i]
+					new = flip.get(old, old) if op == 'toggle' else value
+					edits.append({'pk': row[0], 'col': col, 'changeto': new, 'changefrom': old})
+		# Cell by cell, each only if it still holds the value read above (see applyedits)
+		edits = self.applyedits(edits, 'changeto')
+		if edits is None:
+			return
+		self.pushundo(edits)
+		self.notify(f'{len(edits)} cells changed')
+		if self.visual:
+			self.togglevisual()
+
+	def applyedits(self, edits, field):
+		# Write field ('changeto', or 'changefrom' for undo) of many edits in one transaction. Whole row edits (see
+		# importrows) insert the row, or delete it if field is None. Like changecell, each edit only happens if the db
+		# still has the other field: a cell another program changed since (or a row it deleted, changed or added) is
+		# left as it is, and reported. Returns the edits that were written, or None if it failed.
+		other = 'changefrom' if field == 'changeto' else 'changeto'
+		applied = []
+		conflicts = []
+		try:
+			for edit in edits:
+				if edit['col'] is not None:
+					cur = self.conn.execute(f"UPDATE {dbtable} SET {self.headers[edit['col']]}=? WHERE {self.pkname}=? AND {self.headers[edit['col']]} IS ?;", (edit[field], edit['pk'], edit[other]))
+				elif edit[field] is None:
+					values = json.loads(edit[other])  # the row as it should be now
+					cur = self.conn.execute(f"DELETE FROM {dbtable} WHERE {' AND '.join(f'{col} IS ?' for col in values)};", list(values.values()))
+				else:
+					values = json.loads(edit[field])
+					cur = self.conn.execute(f"INSERT INTO {dbtable} ({', '.join(values)}) VALUES ({', '.join('?' * len(values))}) ON CONFLICT DO NOTHING;", list(values.values()))
+				(applied if cur.rowcount == 1 else conflicts).append(edit)
+			self.conn.commit()
+		except sqlite3.Error as e:
+			self.conn.rollback()
+			self.notify(f'Changing {len(edits)} cells failed: {e}', severity='error')
+			return None
+		self.showcells([edit for edit in applied if edit['col'] is not None], field)
+		if len(applied) < len(edits) or any(edit['col'] is None for edit in applied):
+			self.dropstats()
+			self.rereadwindow()  # rows came or went, or another program's changes should show
+		if conflicts:
+			profiler.count('edit conflicts', len(conflicts))
+			self.notify(f'{len(conflicts)} of {len(edits)} cells or rows were changed by another program since, so they were left as they are (and now show what the db has)', severity='warning')
+		return applied
+
+	def showcells(self, edits, field):
+		# showcell for many cells, with one pass over the window instead of one per cell
+		table = self.query_one(DataTable)
+		values = {}
+		for edit in edits:
+			values.setdefault(edit['pk'], {})[edit['col']] = preview(edit[field])
+		if virtualrows:
+			for page in self.pages:
+				for r in page:
+					for col, value in values.get(self.rowpk(r), {}).items():
+						r[col] = value
+		for pk, cols in values.items():
+			row = self.findrow(pk)
+			if row is not None:
+				for col, value in cols.items():
+					table.update_cell_at((row, col), value)
+		self.dropstats({edit['col'] for edit in edits})
+		self.painted('edit')
+
 	# User is done editing a cell, so clear and hide textbox, show submitted message
 	def on_input_submitted(self):  # function name same as when was event handler for Input; hopefully can just call it in TextAreaInput's key handler
 		#updatecell = self.query_one(Input)
 		updatecell = self.query_one(TextAreaInput)
 		#changeto = updatecell.value
 		changeto = updatecell.text
-		print(f'ct: {changeto}')
 		# updatecell.remove()  # this seems to be the culprit of below bug. Tried moving it after notify, but didn't help (but screen mess up didn't happen until move cursor)
 		updatecell.display = False  # this confirms it. Hide it instead of remove it, and screen mess up bug doesn't happen
+		if self.visual:
+			self.changerange('set', changeto)
+			return
 		table = self.query_one(DataTable)
 		cur_row = table.cursor_coordinate.row
 		cur_col = table.cursor_coordinate.column
@@ -464,7 +2349,11 @@ class TableScreen(Screen):
 			pk = table.get_cell_at((cur_row, self.pki,))
 		else:
 			pk = table.coordinate_to_cell_key((cur_row, cur_col,)).row_key.value
-		changefrom = table.get_cell_at((cur_row, cur_col,))  # TODO: verify with actual db data here too?
+		if self.editfrom and self.editfrom[:2] == (pk, cur_col):
+			changefrom = self.editfrom[2]
+			self.editfrom = None  # used up
+		else:
+			changefrom = self.cellvalue(pk, cur_col)  # the cell may only have a preview
 		#print(f'update {dbtable} set {col}={changeto} where {self.pkname}={pk}')
 		if self.changecell(f'update {dbtable} set {col}=? where {self.pkname}=?', pk, changeto, changefrom, cur_row, cur_col, update_width=True):
 			self.notify('Success!')  # use simple built-in notify instead of showmsg/posize complexity
@@ -486,27 +2375,35 @@ class TableScreen(Screen):
 		vpheight = table.container_viewport.height
 		if where == 'g':
 			row = 0
+			if virtualrows and not self.atstart:
+				self.loadpage('first')
 		elif where == 'G':
 			row = table.row_count - 1
+			if virtualrows and not self.atend:
+				self.loadpage('last')
+				row = self.windowsize() - 1
 		elif where == 'circumflex_accent' or where == '0':
 			col = 0
 		elif where == 'dollar_sign':
 			col = len(table.columns) - 1
-			print(f'col: {len(table.columns) - 1}')
 		elif where == 'ctrl+f':
 			newrow = row + vpheight - 1  # -1 for maybe the scrollbar or cursor being on the row?
-			if newrow > table.row_count - 1:
+			if newrow > table.row_count - 1 and not virtualrows:  # movewindow loads more rows (or clamps) instead
 				row = table.row_count - 1
 			else:
 				row = newrow
 		elif where == 'ctrl+b':
 			newrow = row - vpheight + 1
-			if newrow < 0:
+			if newrow < 0 and not virtualrows:
 				row = 0
 			else:
 				row = newrow
-		table.move_cursor(row=row, column=col)
+		if virtualrows:
+			self.movewindow(row, col)
+		else:
+			table.move_cursor(row=row, column=col)
 		self.count = ''
+		self.painted('jump')
 
 	# Move table's cursor. Parms should be 0,1,-1 to convey which direction to move. (Will be multiplied by the vim-like count.)
 	def action_movecur(self, row, column) -> None:
@@ -534,8 +2431,12 @@ class TableScreen(Screen):
 			linesdown = int(target_col / numcols) - 1  # negative linesdown is lines up
 			target_col = numcols - ((target_col * -1) % numcols)  # *-1 of a known neg number is same as absolute value
 			target_row += linesdown
-		table.move_cursor(row=target_row, column=target_col)
+		if virtualrows:
+			self.movewindow(target_row, target_col)
+		else:
+			table.move_cursor(row=target_row, column=target_col)
 		self.count = ''
+		self.painted('move')
 
 	# Vim-like count
 	def action_add_count(self, num: str) -> None:
@@ -547,23 +2448,8 @@ class TableScreen(Screen):
 		table.cursor_type = next(self.cursors)
 
 	def key_e(self):
-		def getyoffset(cols, table):
-			# Misnomer: gets yoffset AND width for updatecell
-			totwidth = 0
-			curcol = 0
-			for column in table.columns:
-				colwidth = table.columns[column].get_render_width(table)  # table.columns[column].width is width of header it seems
-				if curcol > cols:
-					# Doing this here makes colwidth = width of current column, but totwidth is just the preceeding columns
-					break
-				totwidth += colwidth
-				curcol += 1
-
-			#for i in range(0, cols):
-				#msgbox.update(f'{i}: {list(table.columns)[i].get_render_width(table)}')
-				#time.sleep(1)
-			return colwidth, totwidth
-
+		if self.readonly():
+			return
 		#updatecell = self.query_one(Input)
 		#updatecell = TextAreaInput(id="updatecell")  # nope, can't make a new one each time, as removing it (after submit) causes screen mess up
 		#self.mount(updatecell)
@@ -583,17 +2469,26 @@ class TableScreen(Screen):
 		#			nextone = True
 		#print(updatecell.theme)
 		#updatecell.clear()  # don't need since will put in current value
+		if updatecell.theme != edittheme:
+			updatecell.theme = edittheme
 		updatecell.styles.scrollbar_size_horizontal = 0  # seems to work to hide scrollbars; content still scrolls like I want
 		updatecell.styles.scrollbar_size_vertical = 0
 		table = self.query_one(DataTable)
 		cur_row = table.cursor_coordinate.row
 		cur_col = table.cursor_coordinate.column
-		w, yoffset = getyoffset(cur_col - 1, table)
+		pk = table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value
+		value = self.cellvalue(pk, cur_col)  # not the preview
+		self.editfrom = None
+		if isinstance(value, bytes) and not self.visual:
+			self.notify("Can't edit a blob", severity='error')
+			return
+		self.editfrom = (pk, cur_col, value)  # what the edit is of, even if another program changes it meanwhile
+		yoffset, w = table.columnx(cur_col)  # (x really)
 		updatecell.offset = (yoffset - table.scroll_target_x, cur_row + 1 - table.scroll_target_y)  # assumes all row heights == 1; need +1 to get past header (so assumes header is also height == 1)
 		#updatecell.styles.padding = (0, 1, 0, 1)  # top, right, bottom, left
 		updatecell.styles.padding = (0, 0, 0, 1)  # got rid of right padding as if text filled whole thing, it scrolled left
 		updatecell.styles.width = w
-		updatecell.text = str(table.get_cell_at((cur_row, cur_col,)))
+		updatecell.text = '' if isinstance(value, bytes) else str(value)
 		updatecell.select_all()
 		app.clear_notifications()
 		updatecell.display = True  # 'block' or 'none'
@@ -631,19 +2526,350 @@ class TableScreen(Screen):
 	def key_3(self):
 		self.count += '3'
 
+class TablesScreen(Screen):
+	"""Table picker: t in the table screen. Enter switches to the table under the cursor."""
+	BINDINGS = [("escape", "app.switch_mode('table')", "Back"),]
+
+	def compose(self) -> ComposeResult:
+		yield DataTable(cursor_type='row', zebra_stripes=True)
+
+	def on_screen_resume(self):
+		# Every time it's switched to, since tables may have come and gone
+		tablescreen = self.app.get_screen_stack('table')[0]
+		table = self.query_one(DataTable)
+		table.clear(columns=True)
+		table.add_columns('name', 'type', 'rows')
+		for name, kind, rows in tablescreen.tablelist():
+			table.add_row(name, kind, rows, key=name)
+		table.move_cursor(row=table.get_row_index(dbtable))
+		table.focus()
+
+	async def on_data_table_row_selected(self, event):
+		await self.app.switch_mode('table')
+		self.app.screen.switchtable(event.row_key.value)
+
+class ProfileScreen(Screen):
+	"""What profiler.py recorded, summed up per statement/action."""
+	CSS_PATH = "layers.tcss"
+
+	BINDINGS = [
+		("escape", "app.switch_mode('table')", "back"),
+		("space", "toggle", "recording on/off"),
+		("c", "clear", "clear"),
+		("w", "export", "export"),
+	]
+
+	def compose(self) -> ComposeResult:
+		yield DataTable(cursor_type='row', zebra_stripes=True)
+		yield Static(id='profilestatus')
+
+	def on_screen_resume(self):
+		self.fill()
+
+	def fill(self):
+		table = self.query_one(DataTable)
+		table.clear(columns=True)
+		table.add_columns('kind', 'what', 'count', 'total ms', 'avg ms', 'max ms', 'rows')
+		for kind, what, count, total, most, rows in profiler.summary():
+			table.add_row(kind, ' '.join(what.split())[:100], count, f'{total:.1f}', f'{total / count:.2f}', f'{most:.2f}', rows)
+		counters = ''.join(f', {name}: {n}' for name, n in sorted(profiler.counters.items()))
+		self.query_one('#profilestatus').update(f"Recording {'on' if profiler.enabled else 'off'}, {len(profiler.events)} events{counters}. space: on/off, c: clear, w: export to {profilelog}")
+		table.focus()
+
+	def action_toggle(self):
+		profiler.enabled = not profiler.enabled
+		self.fill()
+
+	def action_clear(self):
+		profiler.clear()
+		self.fill()
+
+	def action_export(self):
+		self.notify(f'{profiler.export(profilelog)} events appended to {profilelog}')
+
+class QueryScreen(Screen):
+	"""SQL console: : in the table screen. Runs any query on the db, with its rows streamed in below."""
+	CSS_PATH = "layers.tcss"
+
+	BINDINGS = [
+		("ctrl+r", "run", "run"),
+		("f5", "run", "run"),
+		("ctrl+up", "history(-1)", "previous query"),
+		("ctrl+down", "history(1)", "next query"),
+		("escape", "stop", "stop the query, or back"),
+	]
+
+	running = False
+	conn = None  # the running query's connection, for interrupt() from here
+	started = None
+	steps = 0  # progress handler calls, i.e. steps * queryprogress sqlite instructions
+	rows = 0
+	recall = None  # where ctrl+up/ctrl+down are in the history
+
+	def compose(self) -> ComposeResult:
+		yield TextArea(id='query')
+		yield DataTable(id='results', zebra_stripes=True)
+		yield Static(id='querystatus')
+
+	def on_mount(self):
+		self.set_interval(0.25, self.ticking)
+		self.query_one('#querystatus').update('ctrl+r or f5: run, ctrl+up/ctrl+down: history, tab: to the results and back, escape: stop/back')
+
+	def on_screen_resume(self):
+		self.query_one('#query').focus()
+
+	@property
+	def tablescreen(self):
+		return self.app.get_screen_stack('table')[0]
+
+	def action_run(self):
+		sql = self.query_one('#query').text.strip()
+		if not sql or self.running:
+			return
+		sidecar.addquery(self.tablescreen.sidecar, sql, maxhistory)
+		self.recall = None
+		self.query_one('#results').clear(columns=True)
+		self.running = True
+		self.started = time.perf_counter()
+		self.steps = self.rows = 0
+		self.runquery(sql)
+
+	def action_stop(self):
+		if not self.running:
+			self.app.switch_mode('table')
+			return
+		# The progress handler stops it at its next call, interrupt() right away (e.g. in the middle of a sort)
+		self.workers.cancel_group(self, 'query')
+		try:
+			if self.conn:
+				self.conn.interrupt()
+		except sqlite3.ProgrammingError:
+			pass  # just finished and closed it
+
+	def action_history(self, step):
+		history = sidecar.queries(self.tablescreen.sidecar)
+		i = len(history) if self.recall is None else self.recall
+		i = min(max(i + step, 0), len(history))  # past the newest is an empty query again
+		self.recall = i
+		self.query_one('#query').load_text(history[i] if i < len(history) else '')
+
+	@work(thread=True, exclusive=True, group='query')
+	def runquery(self, sql):
+		worker = get_current_worker()
+		table = self.query_one('#results')
+		conn = self.tablescreen.connect()
+		# Only reads. Edits go through the table screen, so they can be undone (query_only also means no TEMP tables).
+		conn.execute("PRAGMA query_only=1;")
+
+		def progress():
+			self.steps += 1
+			return worker.is_cancelled
+		conn.set_progress_handler(progress, queryprogress)
+		self.conn = conn
+		error = None
+		shown = 0
+		try:
+			cursor = conn.execute(sql)
+			if cursor.description:
+				app.call_from_thread(table.add_columns, *[column[0] for column in cursor.description])
+			while rows := cursor.fetchmany(querypage):
+				self.rows += len(rows)
+				if shown < queryrows:
+					rows = [[preview(value) for value in r] for r in rows[:queryrows - shown]]
+					shown += len(rows)
+					app.call_from_thread(table.add_rows, rows)
+		except sqlite3.Error as e:
+			error = e
+		finally:
+			self.conn = None
+			conn.close()
+		app.call_from_thread(self.querydone, error, shown, worker.is_cancelled)
+
+	def ticking(self):
+		if self.running:
+			self.query_one('#querystatus').update(f'Running, {time.perf_counter() - self.started:.1f}s: {self.rows} rows, '
+				f'{self.steps * queryprogress:,} sqlite instructions. escape stops it.')
+
+	def querydone(self, error, shown, stopped):
+		self.running = False
+		elapsed = time.perf_counter() - self.started
+		if stopped:
+			msg = f'Stopped after {elapsed:.2f}s and {self.rows} rows'
+		elif error:
+			msg = f'Failed after {elapsed:.2f}s: {error}'
+			self.notify(str(error), severity='error')
+		else:
+			msg = f"{self.rows} rows in {elapsed:.2f}s{f', the first {shown} shown' if shown < self.rows else ''}"
+		self.query_one('#querystatus').update(Text(msg))
+
 class TableApp(App):
+	keytime = None  # perf_counter() of the last key press, while profiling (see TableScreen.painted)
+
 	BINDINGS = [
 		("question_mark", "switch_mode('help')", "Help"),
 	]
 
 	MODES = {
 		'table': TableScreen,
-		'help': HelpScreen
+		'help': HelpScreen,
+		'tables': TablesScreen,
+		'profile': ProfileScreen,
+		'query': QueryScreen,
 	}
 
+	async def on_event(self, event):
+		if profiler.enabled and isinstance(event, events.Key):
+			self.keytime = time.perf_counter()  # before any handler sees it
+		await super().on_event(event)
+
 	def on_mount(self) -> None:
+		profiler.enabled = profiling
 		self.switch_mode("table")
 
+# Command line mode: the same table logic without the TUI, for scripting big jobs. E.g.
+#   sqlite-tui3.py test.db -t places -f 'visited = 0' -s '^a' > rows.tsv
+#   sqlite-tui3.py test.db -t places -e edits.tsv  # then u in the TUI undoes the whole batch
+def cli(argv):
+	import argparse
+	parser = argparse.ArgumentParser(description='sqlite-tui3.py without the TUI (run it without arguments for that). '
+		'Prints the table (or the rows matching --filter/--search), as tab-separated values unless --format says otherwise.')
+	parser.add_argument('db')
+	parser.add_argument('-t', '--table', default=dbtable)
+	parser.add_argument('-f', '--filter', help="e.g. 'visited = 1 and name ~ ^a', same as f in the TUI")
+	parser.add_argument('-s', '--search', help=f'only rows with a cell matching this ({searchmode}, see searchmode)')
+	parser.add_argument('--sort', help='column to sort by')
+	parser.add_argument('--desc', action='store_true')
+	parser.add_argument('--format', choices=sorted(set(export.formats.values())), default='tsv', help='NULL is \\N in tsv, empty in csv')
+	parser.add_argument('-e', '--edits', help="tab-separated file ('-' for stdin) of pk, column, value lines to apply, "
+		"in one undo step. A value of \\N sets NULL, toggle flips a boolean column.")
+	parser.add_argument('--chunk', type=int, default=writebatch, help='edits per transaction')
+	parser.add_argument('--profile', choices=list(dbconn.profiles), default=connprofile, help='how to open the db (see dbconn.py)')
+	args = parser.parse_args(argv)
+	tbl = args.table
+
+	if not os.path.isfile(args.db):
+		print(f'No db file {args.db}', file=sys.stderr)
+		return 1
+	if args.edits and not dbconn.writable(args.profile):
+		print(f"Can't apply edits with the {args.profile} profile", file=sys.stderr)
+		return 1
+	dbstamp = sidecar.stamp(args.db)
+	conn = dbconn.connect(args.db, args.profile, factory=profiler.Connection)
+	conn.create_function('regexp', 2, regexp, deterministic=True)
+	row = conn.execute("SELECT sql, type FROM sqlite_master WHERE name=?", (tbl,)).fetchone()
+	if row is None:
+		print(f'No table {tbl}', file=sys.stderr)
+		return 1
+	tblschema, kind = row
+	# Same pk and boolean column detection as TableScreen.opentable (and the same sidecar cache)
+	fields = conn.execute("SELECT name, type FROM PRAGMA_TABLE_INFO(?);", (tbl,)).fetchall()
+	headers = [field[0] for field in fields]
+	types = {field[0]: field[1].upper() for field in fields}
+	pkname = primarykey(conn, tbl)
+	side = sidecar.connect(args.db)
+	status = 0
+
+	if args.edits:
+		bools = [] if kind == 'view' else [field for field, stats in profilecolumns(conn, side, tbl, tblschema, dbstamp, headers, types, pkname).items() if stats['bool']]
+		journal = undostack.Journal(side, maxundo)
+		changed = failed = 0
+		undoable = True
+
+		def apply(lines):
+			# One transaction per chunk, so a huge file doesn't hold the write lock (or grow the db's journal) the whole time
+			nonlocal changed, failed, undoable
+			edits = []
+			try:
+				for lineno, line in lines:
+					edits.append(edit(line))
+			except (ValueError, sqlite3.Error) as e:
+				conn.rollback()
+				failed += len(lines)
+				print(f'{args.edits}:{lineno}: {e}. Chunk not applied.', file=sys.stderr)
+				return
+			if undoable and not journal.keeps(len(edits)):
+				undoable = False
+				print(f"Over {maxundo} edits (maxundo), so u in the TUI can't undo them", file=sys.stderr)
+			conn.commit()
+			journal.push(tbl, edits)
+			changed += len(edits)
+
+		def edit(line):
+			if len(line) != 3:
+				raise ValueError(f'expected pk, column, value, got {len(line)} fields')
+			pk, col, changeto = line
+			if col not in headers:
+				raise ValueError(f'no column {col}')
+			# Look the row up first: gives the pk as the db has it (the file only has text) and the old value for undo
+			row = conn.execute(f'SELECT {pkname}, {col} FROM {tbl} WHERE {pkname}=?', (pk,)).fetchone()
+			if row is None:
+				raise ValueError(f'no row {pk}')
+			pk, changefrom = row
+			if changeto == '\\N':
+				changeto = None
+			elif changeto == 'toggle':
+				if col not in bools:
+					raise ValueError(f"{col} isn't a boolean column, so it can't be toggled")
+				changeto = {0: 1, 1: 0, '0': '1', '1': '0'}.get(changefrom)
+				if changeto is None:
+					raise ValueError(f'{col} is {changefrom!r} in row {pk}, not 0 or 1')
+			conn.execute(f'update {tbl} set {col}=? where {pkname}=?', (changeto, pk))
+			return {'pk': pk, 'col': headers.index(col), 'changefrom': changefrom, 'changeto': changeto}
+
+		f = sys.stdin if args.edits == '-' else open(args.edits, newline='')
+		with journal.group():
+			lines = []
+			for lineno, line in enumerate(csv.reader(f, delimiter='\t'), 1):
+				if line:
+					lines.append((lineno, line))
+				if len(lines) >= args.chunk:
+					apply(lines)
+					lines = []
+			if lines:
+				apply(lines)
+		print(f'{changed} cells changed' + (f', {failed} not' if failed else ''), file=sys.stderr)
+		status = 1 if failed else 0
+		if not (args.filter or args.search):
+			return status
+
+	# Stream the rows, same query as the TUI pages through (see pager.py), just without a LIMIT
+	pg = pager.Pager(conn, tbl, pkname, view=kind == 'view')
+	if args.sort:
+		if args.sort not in headers:
+			print(f'No column {args.sort}', file=sys.stderr)
+			return 1
+		pg.sortcol = args.sort
+	pg.desc = args.desc
+	try:
+		if args.filter:
+			pg.filter, pg.parms, preds = pager.compilefilter(args.filter, headers, args.sort or headers[0])
+		if args.search and searchmode == 'regexp':
+			re.compile(args.search)
+	except (ValueError, re.error) as e:
+		print(e, file=sys.stderr)
+		return 1
+	cond = ''
+	parms = dict(pg.parms)
+	if args.search:
+		op, parms['p'] = searchop(args.search)
+		cond = ' OR '.join(f'{col} {op} :p' for col in headers)
+	try:
+		export.write(sys.stdout, args.format, conn.execute(pg.sql(cond, columns=headers), parms))
+		sys.stdout.flush()
+	except BrokenPipeError:
+		os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())  # e.g. piped into head, which is fine
+	except sqlite3.Error as e:
+		print(e, file=sys.stderr)
+		return 1
+	return status
+
+phase('imports')
 app = TableApp()
 if __name__ == "__main__":
+	if len(sys.argv) > 1:
+		sys.exit(cli(sys.argv[1:]))
 	app.run()
+	if startuptimes:
+		for name, ms in phases:
+			print(f'{name:12} {ms:8.1f} ms')
+		print(f"{'total':12} {sum(ms for name, ms in phases):8.1f} ms")
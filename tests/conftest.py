@@ -0,0 +1,32 @@
+# sqlite-tui3.py isn't importable by name (the -), so each test loads its own copy of it, in a temp dir with a
+# fresh test.db (the app looks for dbfname from the cwd up), so settings changed by one test don't leak.
+
+import importlib.util
+import os
+import sqlite3
+import sys
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+	path = tmp_path / 'test.db'
+	conn = sqlite3.connect(path)
+	conn.execute('create table places (id integer primary key, name text, visited integer, note text)')
+	conn.executemany('insert into places (name, visited, note) values (?, ?, ?)', [(f'place{i}', i % 2, f'note {i}') for i in range(50)])
+	conn.commit()
+	conn.close()
+	monkeypatch.chdir(tmp_path)
+	return str(path)
+
+@pytest.fixture
+def tui(db, monkeypatch):
+	spec = importlib.util.spec_from_file_location('tui', os.path.join(root, 'sqlite-tui3.py'))
+	module = importlib.util.module_from_spec(spec)
+	monkeypatch.setitem(sys.modules, 'tui', module)  # textual looks classes' files (CSS_PATH) up through it
+	spec.loader.exec_module(module)
+	module.pollinterval = 0
+	return module
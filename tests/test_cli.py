@@ -0,0 +1,24 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import root
+
+def cli(*args):
+	return subprocess.run([sys.executable, os.path.join(root, 'sqlite-tui3.py'), *args], capture_output=True, text=True)
+
+def test_toggle_needs_boolean_column(db, tmp_path):
+	edits = tmp_path / 'edits.tsv'
+	edits.write_text('1\tname\ttoggle\n')
+	result = cli(db, '-t', 'places', '-e', str(edits))
+	assert result.returncode == 1
+	assert "isn't a boolean column" in result.stderr
+	assert sqlite3.connect(db).execute('select name from places where id = 1').fetchone()[0] == 'place0'
+
+def test_toggle_boolean_column(db, tmp_path):
+	edits = tmp_path / 'edits.tsv'
+	edits.write_text('1\tvisited\ttoggle\n')
+	result = cli(db, '-t', 'places', '-e', str(edits))
+	assert result.returncode == 0, result.stderr
+	assert sqlite3.connect(db).execute('select visited from places where id = 1').fetchone()[0] == 1
@@ -0,0 +1,21 @@
+import asyncio
+
+async def waitfor(pilot, check, timeout=5):
+	for i in range(int(timeout / 0.05)):
+		if check():
+			return True
+		await pilot.pause(0.05)
+	return check()
+
+def test_stats_follow_column_cursor(tui):
+	async def run():
+		async with tui.app.run_test(size=(100, 30)) as pilot:
+			await pilot.pause()
+			statusbar = tui.app.screen.query_one('#statusbar')
+			await pilot.press('i')
+			assert await waitfor(pilot, lambda: str(statusbar.content).startswith('id:'))
+			await pilot.press('c')  # column cursor
+			assert tui.app.screen.query_one(tui.DataTable).cursor_type == 'column'
+			await pilot.press('l')
+			assert await waitfor(pilot, lambda: str(statusbar.content).startswith('name:'))
+	asyncio.run(run())
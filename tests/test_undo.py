@@ -0,0 +1,37 @@
+import asyncio
+import sqlite3
+
+def test_conflicted_undo_stays_undoable(tui, db):
+	async def run():
+		async with tui.app.run_test(size=(100, 30)) as pilot:
+			await pilot.pause()
+			screen = tui.app.screen
+			await pilot.press('l', 'e')
+			screen.query_one(tui.TextAreaInput).load_text('edited')
+			await pilot.press('enter')
+			other = sqlite3.connect(db)
+			other.execute("update places set name = 'other' where id = 1")
+			other.commit()
+			for i in range(2):
+				await pilot.press('u')
+				assert 'changed by another program' in [n.message for n in tui.app._notifications][-1]  # not 'Already at oldest change'
+			other.execute("update places set name = 'edited' where id = 1")
+			other.commit()
+			await pilot.press('u')
+			assert other.execute('select name from places where id = 1').fetchone()[0] == 'place0'
+	asyncio.run(run())
+
+def test_range_undo_skips_cells_changed_elsewhere(tui, db):
+	async def run():
+		async with tui.app.run_test(size=(100, 30)) as pilot:
+			await pilot.pause()
+			screen = tui.app.screen
+			name = screen.headers.index('name')
+			screen.changerange('set', 'x', (1, 3, name, name))
+			other = sqlite3.connect(db)
+			other.execute("update places set name = 'other' where id = 2")
+			other.commit()
+			await pilot.press('u')
+			assert [row[0] for row in other.execute('select name from places where id <= 3 order by id')] == ['place0', 'other', 'place2']
+			assert any('1 of 3 cells or rows were changed by another program' in n.message for n in tui.app._notifications)
+	asyncio.run(run())
@@ -1,106 +1,148 @@
-from rich import inspect
-
-# From: https://stackoverflow.com/questions/66503901/undo-redo-implementation-using-stack
-
-# Usage: push, pop, undo, redo
-
-class Node:
-	def __init__(self, data=None):
-		self.data = data
-		self.next = None
-		self.prev = None
-
-	def __str__(self):
-		return f"Node({self.data})"
-
-
-class Stack:
-	def __init__(self):
-		self.pointer = None
-		self.beginning = None
-
-	def push(self, x):
-		# Make a new node to be pushed onto stack
-		if not isinstance(x, Node):
-			x = Node(x)
-
-		if self.is_empty():
-			# If stack is empty (points to None), point to the new single node (no next or prev)
-			self.pointer = x
-			self.beginning = x
-		else:
-			# stack not empty.
-			x.next = self.pointer  # New node's next points to current: x->current
-			self.pointer.prev = x  # current's prev points to new node: x<->current
-			self.pointer = x  # pointer->x<->older (was "current"; x is now the new current)
-
-	def pop(self):
-		if self.is_empty():
-			print(f'Stack Underflow')
-		else:
-			self.pointer = self.pointer.next
-
-	def is_empty(self):
-		return self.pointer is None
-
-	def __str__(self):
-		string = ''
-		current = self.pointer
-		while current:
-			string += f'{current.data}->'
-			current = current.next
-		if string:
-			print(f'Stack Pointer = {self.pointer.data}')
-			return f'[{string[:-2]}]'
-		return '[]'
-
-	def undo(self):
-		x = self.pointer
-		self.pop()  # moves pointer to next (older) which will be None if reached end
-		if x is None:
+# Undo/redo journal, kept in the sidecar file (see sidecar.py) so it survives restarts.
+# One compact record per changed cell: table, pk, column#, old and new value. Records pushed together (or inside
+# group()) share a seq and are undone/redone as one step. Past maxentries records, the oldest steps are dropped.
+# Steps are kept or dropped whole: one that alone has more than maxentries records is dropped (see keeps), never
+# kept in part, since undoing part of an import or range edit would be worse than not being able to undo it.
+# Inserted/deleted rows are a record with no column#, and the whole row (as JSON) or NULL for old and new.
+
+# Usage: push, keeps, undo, redo, mark, forget, group
+
+import sqlite3
+from contextlib import contextmanager
+
+schema = """
+CREATE TABLE IF NOT EXISTS undo (
+	seq INTEGER,  -- undo step
+	tbl TEXT,
+	pk,
+	col INTEGER,  -- column# (cid), NULL for a whole row
+	old,  -- no declared types, so values come back the type they went in as
+	new,
+	undone INTEGER DEFAULT 0  -- 1 = undone, i.e. available for redo
+);
+CREATE INDEX IF NOT EXISTS undo_seq ON undo (tbl, seq);
+"""
+
+class Journal:
+	def __init__(self, conn, maxentries=100000):
+		self.conn = conn
+		self.maxentries = maxentries
+		self.conn.executescript(schema)
+		self.groupseq = None  # seq to use while inside group()
+		self.toobig = None  # seq of the group that got dropped for being too big (the rest of it is dropped too)
+		self.lastseq = None  # seq of the last push
+
+	def nextseq(self):
+		return self.conn.execute("SELECT coalesce(max(seq), 0) + 1 FROM undo;").fetchone()[0]
+
+	def push(self, tbl, edits):
+		# edits: dicts with pk, col, changefrom and changeto (same as TableScreen uses). All one undo step.
+		# Returns False if the step is too big to keep, and so was dropped.
+		if not edits:
+			return True
+		# A new change makes whatever was undone unreachable (no redo branches)
+		self.conn.execute("DELETE FROM undo WHERE tbl=? AND undone=1;", (tbl,))
+		seq = self.groupseq or self.nextseq()
+		if seq == self.toobig or len(edits) > self.maxentries - self.size(seq):
+			self.conn.execute("DELETE FROM undo WHERE seq=?;", (seq,))
+			self.conn.commit()
+			if self.groupseq:
+				self.toobig = seq
 			return False
-		else:
-			return(x.data)
-
-	def redo(self):
-		if self.pointer:
-			x = self.pointer.prev
-		else:
-			print('redo: no pointer, so no prev')
-			#return False  # Wrong!
-			if self.beginning:
-				self.push(self.beginning)
-				return(self.beginning.data)
-			else:
-				return False
-		if x is None:
-			print('redo: pointer.prev is None')
-			return False
-		else:
-			self.push(x)
-			return(x.data)
+		self.conn.executemany("INSERT INTO undo (seq, tbl, pk, col, old, new) VALUES (?, ?, ?, ?, ?, ?);",
+			[(seq, tbl, edit['pk'], edit['col'], edit['changefrom'], edit['changeto']) for edit in edits])
+		self.evict(seq)
+		self.conn.commit()
+		self.lastseq = seq
+		return True
+
+	def size(self, seq):
+		return self.conn.execute("SELECT count(*) FROM undo WHERE seq=?;", (seq,)).fetchone()[0]
+
+	def keeps(self, n):
+		# Would the step being pushed (the group's, or a new one) still be kept with n more records? For warning before
+		# a change gets committed that it won't be undoable.
+		if self.groupseq is None:
+			return n <= self.maxentries
+		return self.groupseq != self.toobig and self.size(self.groupseq) + n <= self.maxentries
+
+	def evict(self, seq):
+		# Drop the oldest steps (whole ones) until there are at most maxentries records. Never seq, the step being pushed.
+		cutoff = self.conn.execute("SELECT seq FROM undo ORDER BY seq DESC LIMIT 1 OFFSET ?;", (self.maxentries,)).fetchone()
+		if cutoff:
+			self.conn.execute("DELETE FROM undo WHERE seq <= ? AND seq != ?;", (cutoff[0], seq))
+
+	@contextmanager
+	def group(self):
+		# Everything pushed inside this is one undo step
+		if self.groupseq:
+			yield  # already in a group
+			return
+		self.groupseq = self.nextseq()
+		try:
+			yield
+		finally:
+			self.groupseq = self.toobig = None
+
+	def edits(self, tbl, seq):
+		rows = self.conn.execute("SELECT pk, col, old, new FROM undo WHERE tbl=? AND seq=? ORDER BY rowid;", (tbl, seq))
+		return [{'pk': pk, 'col': col, 'changefrom': old, 'changeto': new, 'seq': seq} for pk, col, old, new in rows]
+
+	# undo() and redo() only say what to write. The step moves once mark() says it got written, so one that failed
+	# (e.g. another program changed the cell since) is still there to try again.
+	def undo(self, tbl):
+		# Edits of the newest step not undone yet (to be applied in reverse), or None if there's nothing to undo
+		row = self.conn.execute("SELECT max(seq) FROM undo WHERE tbl=? AND undone=0;", (tbl,)).fetchone()
+		if row[0] is None:
+			return None
+		edits = self.edits(tbl, row[0])
+		edits.reverse()
+		return edits
+
+	def redo(self, tbl):
+		# Edits of the oldest undone step, or None if there's nothing to redo
+		row = self.conn.execute("SELECT min(seq) FROM undo WHERE tbl=? AND undone=1;", (tbl,)).fetchone()
+		if row[0] is None:
+			return None
+		return self.edits(tbl, row[0])
+
+	def mark(self, tbl, seq, undone):
+		self.conn.execute("UPDATE undo SET undone=? WHERE tbl=? AND seq=?;", (undone, tbl, seq))
+		self.conn.commit()
+
+	def forget(self, tbl, seq):
+		# Drop a step whose change didn't make it to the db after all
+		self.conn.execute("DELETE FROM undo WHERE tbl=? AND seq=?;", (tbl, seq))
+		self.conn.commit()
 
 if __name__ == "__main__":
-	stack = Stack()
-
-	stack.push(1)
-	stack.push(2)
-	stack.push(3)
-	stack.push(4)
-	stack.push(5)
-
-	print("stack is:")
-	print(stack)
-	print()
-
-	print(stack.undo())
-
-	print("after undo:")
-	print(stack)
-	print()
-	inspect(stack.pointer)
-
-	print(stack.redo())
-
-	print("after redo:")
-	print(stack)
+	journal = Journal(sqlite3.connect(':memory:'), maxentries=4)
+
+	for i in range(1, 6):
+		journal.push('t', [{'pk': i, 'col': 1, 'changefrom': i - 1, 'changeto': i}])
+	with journal.group():
+		journal.push('t', [{'pk': 6, 'col': 1, 'changefrom': 'a', 'changeto': 'b'}])
+		journal.push('t', [{'pk': 7, 'col': 1, 'changefrom': 'c', 'changeto': 'd'}])
+
+	def undo():
+		edits = journal.undo('t')
+		if edits:
+			journal.mark('t', edits[0]['seq'], 1)
+		return edits
+
+	def redo():
+		edits = journal.redo('t')
+		if edits:
+			journal.mark('t', edits[0]['seq'], 0)
+		return edits
+
+	print("undo:", undo())
+	print("undo:", undo())
+	print("redo:", redo())
+	print("undo:", undo())
+	print("undo:", undo())
+	print("undo:", undo())  # evicted
+	with journal.group():
+		print("push:", journal.push('t', [{'pk': 8, 'col': 1, 'changefrom': 'e', 'changeto': 'f'}] * 3), journal.keeps(2))
+		print("push:", journal.push('t', [{'pk': 9, 'col': 1, 'changefrom': 'g', 'changeto': 'h'}] * 2))  # too big, so all of it goes
+	print("undo:", undo())
@@ -0,0 +1,135 @@
+# Write-behind for cell edits (see writebehind in sqlite-tui3.py). Edits go into a queue and a dedicated thread
+# applies them in batched transactions, so a burst of edits costs one commit (one WAL fsync) instead of one each.
+# A batch is committed once it's delay seconds old or has batchsize edits, or on flush()/close().
+# While another program holds the write lock, the batch waits busy_timeout (see dbconn.py), then retries with
+# exponential backoff, up to retries times, before it fails. The UI thread never waits for any of it.
+
+# Usage: put, flush, close
+
+import queue
+import sqlite3
+import threading
+import time
+
+import dbconn
+import profiler
+
+class Writer:
+	def __init__(self, dbfile, done, delay=0.5, batchsize=500, factory=sqlite3.Connection, profile='default', retries=5, backoff=0.1):
+		# done(applied, failed) gets called from the writer thread after each batch. Edits are dicts with at least
+		# 'sql' and 'parms'. Failed ones get an 'error' added, and 'conflict' if they updated no row (e.g. a conditional
+		# UPDATE whose old value wasn't there anymore). factory is the writer's connection class, profile its
+		# connection profile (see dbconn.py). backoff is the first wait (seconds) after a busy write lock, doubled each retry.
+		self.dbfile = dbfile
+		self.factory = factory
+		self.profile = profile
+		self.done = done
+		self.delay = delay
+		self.batchsize = batchsize
+		self.retries = retries
+		self.backoff = backoff
+		self.queue = queue.Queue()
+		self.thread = threading.Thread(target=self.run, name='writer', daemon=True)
+		self.thread.start()
+
+	def put(self, edit):
+		self.queue.put(edit)
+
+	def flush(self, then=None):
+		# Commit everything queued so far and wait for it. Returns the edits that failed. With then, returns right away
+		# instead, and the writer thread calls then(failed edits) once it's done (it may be waiting out a lock).
+		flushed = threading.Event()
+		marker = {'flush': flushed, 'failed': [], 'then': then}
+		self.queue.put(marker)
+		if then:
+			return None
+		flushed.wait()
+		return marker['failed']
+
+	def close(self):
+		failed = self.flush()
+		self.queue.put(None)
+		self.thread.join()
+		return failed
+
+	def run(self):
+		conn = dbconn.connect(self.dbfile, self.profile, factory=self.factory, isolation_level=None)  # autocommit, so BEGIN/COMMIT are ours
+		while True:
+			edit = self.queue.get()
+			if edit is None:
+				break
+			batch = []
+			markers = []
+			deadline = time.monotonic() + self.delay
+			while True:
+				if 'flush' in edit:
+					markers.append(edit)
+					break
+				batch.append(edit)
+				if len(batch) >= self.batchsize:
+					break
+				try:
+					edit = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+				except queue.Empty:
+					break
+				if edit is None:
+					self.queue.put(None)  # stop after this batch
+					break
+			applied, failed = self.apply(conn, batch)
+			if batch:
+				self.done(applied, failed)
+			for marker in markers:
+				marker['failed'] = failed
+				marker['flush'].set()
+				if marker['then']:
+					marker['then'](failed)
+		conn.close()
+
+	def apply(self, conn, batch):
+		applied = []
+		failed = []
+		if not batch:
+			return applied, failed
+		try:
+			self.begin(conn)
+			for edit in batch:
+				# Savepoint per edit, so one bad edit doesn't take the rest of the batch with it
+				conn.execute("SAVEPOINT edit;")
+				try:
+					cur = conn.execute(edit['sql'], edit['parms'])
+				except sqlite3.Error as e:
+					edit['error'] = str(e)
+				else:
+					if cur.rowcount != 1:
+						edit['error'] = f'updated {cur.rowcount} rows'
+						edit['conflict'] = cur.rowcount == 0
+				if 'error' in edit:
+					conn.execute("ROLLBACK TO edit;")
+					failed.append(edit)
+				else:
+					applied.append(edit)
+				conn.execute("RELEASE edit;")
+			conn.execute("COMMIT;")
+		except sqlite3.Error as e:
+			# BEGIN or COMMIT failed (e.g. database is locked), so none of it made it
+			if conn.in_transaction:
+				conn.execute("ROLLBACK;")
+			for edit in batch:
+				edit.setdefault('error', str(e))
+			applied, failed = [], batch
+		return applied, failed
+
+	def begin(self, conn):
+		# BEGIN IMMEDIATE takes the write lock up front, so nothing after it can find the db locked
+		for attempt in range(self.retries + 1):
+			try:
+				conn.execute("BEGIN IMMEDIATE;")
+				return
+			except sqlite3.OperationalError as e:
+				if not dbconn.busy(e):
+					raise
+				if attempt == self.retries:
+					profiler.count('lock timeouts')
+					raise
+			profiler.count('lock retries')
+			time.sleep(self.backoff * 2 ** attempt)